@@ -0,0 +1,110 @@
+import time
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+from app.database.redis_client import get_redis
+
+
+MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с временем жизни записей и счетчиками попаданий/промахов"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    # Асинхронный интерфейс, общий с RedisCache
+    async def aget(self, key: Hashable, default: Any = MISSING) -> Any:
+        return self.get(key, default)
+
+    async def aset(self, key: Hashable, value: Any):
+        self.set(key, value)
+
+    async def aset_many(self, items: Dict[Hashable, Any]):
+        for key, value in items.items():
+            self.set(key, value)
+
+    async def ainvalidate(self, key: Hashable):
+        self.invalidate(key)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
+
+
+class RedisCache:
+    """Кэш в Redis с временем жизни записей, общий для всех процессов бота.
+
+    Интерфейс совпадает с асинхронными методами TTLCache. Значения хранятся в JSON;
+    dumps/loads переводят их в JSON-совместимый вид и обратно.
+    """
+
+    def __init__(self, prefix: str, ttl: float = 300,
+                 dumps: Callable[[Any], Any] = None, loads: Callable[[Any], Any] = None):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.dumps = dumps
+        self.loads = loads
+        self.hits = 0
+        self.misses = 0
+
+    def _encode(self, value: Any) -> str:
+        if value is not None and self.dumps:
+            value = self.dumps(value)
+        return json.dumps(value, ensure_ascii=False)
+
+    async def aget(self, key: Hashable, default: Any = MISSING) -> Any:
+        raw = await get_redis().get(f"{self.prefix}{key}")
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        value = json.loads(raw)
+        if value is not None and self.loads:
+            value = self.loads(value)
+        return value
+
+    async def aset(self, key: Hashable, value: Any):
+        await get_redis().set(f"{self.prefix}{key}", self._encode(value), px=int(self.ttl * 1000))
+
+    async def aset_many(self, items: Dict[Hashable, Any]):
+        if not items:
+            return
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(f"{self.prefix}{key}", self._encode(value), px=int(self.ttl * 1000))
+            await pipe.execute()
+
+    async def ainvalidate(self, key: Hashable):
+        await get_redis().delete(f"{self.prefix}{key}")
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
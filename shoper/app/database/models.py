@@ -1,7 +1,8 @@
 import os
 import datetime
 from sqlalchemy import Column, DateTime
-from sqlalchemy import BigInteger, String, ForeignKey, Boolean, Float, Text
+from sqlalchemy import BigInteger, String, ForeignKey, Boolean, Float, Text, Integer
+from sqlalchemy import Index, event, inspect, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 
@@ -9,7 +10,27 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-engine = create_async_engine(url="sqlite+aiosqlite:///db.sqlite3")
+# DATABASE_URL позволяет указать другой файл базы (например, временный для бенчмарка)
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///db.sqlite3')
+
+engine = create_async_engine(url=DATABASE_URL)
+
+# Настройки SQLite для каждого соединения
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # читатели не блокируют запись
+    "synchronous": "NORMAL",     # в режиме WAL безопасно и без fsync на каждый коммит
+    "cache_size": -20000,        # ~20 МБ кэша страниц
+    "mmap_size": 268435456,      # 256 МБ memory-mapped I/O
+    "temp_store": "MEMORY",
+}
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
 
 async_session = async_sessionmaker(engine)
 
@@ -22,18 +43,24 @@ class User(Base):
     __tablename__ = "users"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    tg_id = mapped_column(BigInteger)
+    tg_id = mapped_column(BigInteger, index=True)
     name: Mapped[str] = mapped_column(String(25), nullable=True)
     phone_number: Mapped[str] = mapped_column(String(25), nullable=True)
+    digest_mode: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)  # Уведомления одной сводкой
 
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_user_active", "user_id", "is_active"),
+        Index("ix_products_active_article", "is_active", "article_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     name: Mapped[str] = mapped_column(String(255))
     url: Mapped[str] = mapped_column(Text)
+    article_id: Mapped[str] = mapped_column(String(20), nullable=True)  # Артикул WB, извлекается из url при добавлении
     current_price: Mapped[float] = mapped_column(Float)
     previous_price: Mapped[float] = mapped_column(Float, nullable=True)
     price_threshold: Mapped[float] = mapped_column(Float, default=50.0)  # Порог для уведомлений
@@ -42,6 +69,71 @@ class Product(Base):
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
 
 
+class Article(Base):
+    """Данные трекера по артикулу: источник цены и расписание проверок"""
+    __tablename__ = "articles"
+
+    article_id: Mapped[str] = mapped_column(String(20), primary_key=True)
+    # Какой API/хост basket ответил в прошлый раз
+    source: Mapped[str] = mapped_column(String(10), nullable=True)  # v2 / v1 / basket
+    basket_host: Mapped[str] = mapped_column(String(255), nullable=True)
+    resolved_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=True)
+    # Адаптивное расписание: интервал проверки (сек) подстраивается под частоту изменений цены
+    check_interval: Mapped[float] = mapped_column(Float, nullable=True)
+    next_check_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=True)
+
+
+class PriceHistory(Base):
+    """История цен по артикулам: строка пишется только при изменении цены"""
+    __tablename__ = "price_history"
+    __table_args__ = (
+        Index("ix_price_history_article_created", "article_id", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    article_id: Mapped[str] = mapped_column(String(20))
+    price_cents: Mapped[int] = mapped_column(Integer)  # Цена в копейках
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.now)
+
+
+class TrackerWorker(Base):
+    """Процесс-воркер трекера цен и время его последнего heartbeat"""
+    __tablename__ = "tracker_workers"
+
+    worker_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    heartbeat_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+
+class TrackerLease(Base):
+    """Аренда партиции артикулов воркером трекера; истекшая аренда может быть перехвачена"""
+    __tablename__ = "tracker_leases"
+
+    partition: Mapped[int] = mapped_column(Integer, primary_key=True)
+    worker_id: Mapped[str] = mapped_column(String(64), nullable=True)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=True)
+
+
+def _add_missing_columns(sync_conn):
+    """Легкая миграция: добавляет в существующие таблицы колонки, появившиеся в моделях"""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+def _create_missing_indexes(sync_conn):
+    """Легкая миграция: создает индексы моделей, которых нет в существующей базе"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 async def init_models():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
\ No newline at end of file
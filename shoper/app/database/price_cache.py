@@ -0,0 +1,41 @@
+import os
+import time
+from typing import Dict, NamedTuple, Optional
+
+from app.database.cache import TTLCache, RedisCache, MISSING
+from app.database.redis_client import redis_enabled
+from app.database.request import CACHE_LOOKUPS
+
+
+# Последняя известная цена по артикулу; сколько хранить запись (свежесть проверяет вызывающий код)
+LATEST_PRICE_TTL = float(os.getenv('WB_LATEST_PRICE_TTL', 24 * 3600))
+LATEST_PRICE_CACHE_SIZE = int(os.getenv('WB_LATEST_PRICE_CACHE_SIZE', 100000))
+
+
+class LatestPrice(NamedTuple):
+    price: float
+    name: Optional[str]
+    checked_at: float  # unix time проверки
+
+
+if redis_enabled():
+    latest_price_cache = RedisCache('wb:price:', LATEST_PRICE_TTL, dumps=list, loads=lambda data: LatestPrice(*data))
+else:
+    latest_price_cache = TTLCache(LATEST_PRICE_CACHE_SIZE, LATEST_PRICE_TTL)
+
+CACHE_LOOKUPS.set_function(lambda: latest_price_cache.hits, 'latest_price', 'hit')
+CACHE_LOOKUPS.set_function(lambda: latest_price_cache.misses, 'latest_price', 'miss')
+
+
+async def set_latest_prices(prices: Dict[str, float], names: Optional[Dict[str, str]] = None):
+    """Запоминает только что полученные цены: {article_id: цена}, names — {article_id: название}"""
+    now = time.time()
+    names = names or {}
+    await latest_price_cache.aset_many({
+        article_id: LatestPrice(price, names.get(article_id), now) for article_id, price in prices.items()
+    })
+
+
+async def get_latest_price(article_id: str) -> Optional[LatestPrice]:
+    entry = await latest_price_cache.aget(article_id)
+    return None if entry is MISSING else entry
@@ -0,0 +1,42 @@
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+# Redis необязателен: без REDIS_URL бот хранит FSM и кэши в памяти процесса
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+_redis = None
+
+
+def redis_enabled() -> bool:
+    return bool(REDIS_URL) or _redis is not None
+
+
+def get_redis() -> Optional["aioredis.Redis"]:
+    """Общий клиент Redis процесса (соединения открываются лениво), None если Redis не настроен"""
+    global _redis
+    if _redis is None and REDIS_URL:
+        if aioredis is None:
+            raise RuntimeError("Задан REDIS_URL, но пакет redis не установлен: pip install redis")
+        _redis = aioredis.from_url(REDIS_URL)
+    return _redis
+
+
+def set_redis(client):
+    """Подставляет готовый клиент (например, fakeredis для локальной проверки)"""
+    global _redis
+    _redis = client
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -1,8 +1,44 @@
-from app.database.models import async_session, User, Product
-from sqlalchemy import select, update
-from typing import List, Optional
+import os
+import datetime
+from app.database.cache import TTLCache, RedisCache, MISSING
+from app.database.redis_client import redis_enabled
+from app.service.metrics import Histogram, Counter, timed
+from app.database.models import (
+    async_session, User, Product, Article, PriceHistory, TrackerWorker, TrackerLease,
+)
+from sqlalchemy import select, update, insert, delete, bindparam, func, tuple_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 
+# Время выполнения функций работы с базой
+DB_SECONDS = Histogram('wb_db_seconds', 'Время выполнения запросов к базе по функциям', ['function'])
+
+# Кэш пользователей: tg_id -> User (или None) и users.id -> tg_id
+USER_CACHE_TTL = float(os.getenv('WB_USER_CACHE_TTL', 300))
+USER_CACHE_SIZE = int(os.getenv('WB_USER_CACHE_SIZE', 10000))
+
+
+def _user_to_dict(user: User) -> dict:
+    return {column.name: getattr(user, column.name) for column in User.__table__.columns}
+
+
+# С Redis кэш общий для всех реплик бота и воркеров трекера, иначе — в памяти процесса
+if redis_enabled():
+    user_cache = RedisCache('wb:user:', USER_CACHE_TTL, dumps=_user_to_dict, loads=lambda data: User(**data))
+    user_tg_id_cache = RedisCache('wb:user_tg:', USER_CACHE_TTL)
+else:
+    user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+    user_tg_id_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# Попадания и промахи кэшей считаются в самих кэшах, метрика читает их при запросе
+CACHE_LOOKUPS = Counter('wb_cache_lookups_total', 'Обращения к кэшам приложения', ['cache', 'result'])
+for _name, _cache in (('user', user_cache), ('user_tg_id', user_tg_id_cache)):
+    CACHE_LOOKUPS.set_function(lambda cache=_cache: cache.hits, _name, 'hit')
+    CACHE_LOOKUPS.set_function(lambda cache=_cache: cache.misses, _name, 'miss')
+
+
+@timed(DB_SECONDS)
 async def set_user(tg_id):
     async with async_session() as session:
         user = await session.scalar(select(User).where(User.tg_id == tg_id))
@@ -10,29 +46,65 @@ async def set_user(tg_id):
         if not user:
             session.add(User(tg_id=tg_id))
             await session.commit()
+            await user_cache.ainvalidate(tg_id)
             return False
         return True if user.name else False
 
 
+@timed(DB_SECONDS)
 async def get_user(tg_id):
+    user = await user_cache.aget(tg_id)
+    if user is not MISSING:
+        return user
+    async with async_session() as session:
+        user = await session.scalar(select(User).where(User.tg_id == tg_id))
+    await user_cache.aset(tg_id, user)
+    if user:
+        await user_tg_id_cache.aset(user.id, tg_id)
+    return user
+
+
+@timed(DB_SECONDS)
+async def get_user_by_id(user_id: int):
+    """Возвращает пользователя по users.id (products.user_id)"""
+    tg_id = await user_tg_id_cache.aget(user_id)
+    if tg_id is not MISSING:
+        return await get_user(tg_id)
     async with async_session() as session:
-        return await session.scalar(select(User).where(User.tg_id == tg_id))
+        user = await session.scalar(select(User).where(User.id == user_id))
+    if user:
+        await user_tg_id_cache.aset(user_id, user.tg_id)
+        await user_cache.aset(user.tg_id, user)
+    return user
 
 
+@timed(DB_SECONDS)
 async def update_user(tg_id, name, phone_number):
     async with async_session() as session:
         await session.execute(update(User).where(User.tg_id == tg_id).values(name=name,
                                                                              phone_number=phone_number))
         await session.commit()
+    await user_cache.ainvalidate(tg_id)
+
+
+@timed(DB_SECONDS)
+async def set_user_digest_mode(tg_id, enabled: bool):
+    async with async_session() as session:
+        await session.execute(update(User).where(User.tg_id == tg_id).values(digest_mode=enabled))
+        await session.commit()
+    await user_cache.ainvalidate(tg_id)
 
 
 # Функции для работы с товарами
-async def add_product(user_id: int, name: str, url: str, current_price: float, price_threshold: float = 50.0) -> Product:
+@timed(DB_SECONDS)
+async def add_product(user_id: int, name: str, url: str, current_price: float, price_threshold: float = 50.0,
+                      article_id: Optional[str] = None) -> Product:
     async with async_session() as session:
         product = Product(
             user_id=user_id,
             name=name,
             url=url,
+            article_id=article_id,
             current_price=current_price,
             price_threshold=price_threshold
         )
@@ -42,6 +114,30 @@ async def add_product(user_id: int, name: str, url: str, current_price: float, p
         return product
 
 
+@timed(DB_SECONDS)
+async def add_products_bulk(user_id: int, items: List[Tuple[str, str, float, str]],
+                            price_threshold: float = 50.0) -> int:
+    """Добавляет товары одной транзакцией: items — (название, url, цена, артикул). Возвращает число товаров"""
+    if not items:
+        return 0
+    rows = [
+        {
+            'user_id': user_id,
+            'name': name,
+            'url': url,
+            'current_price': price,
+            'price_threshold': price_threshold,
+            'article_id': article_id,
+        }
+        for name, url, price, article_id in items
+    ]
+    async with async_session() as session:
+        await session.execute(insert(Product), rows)
+        await session.commit()
+    return len(rows)
+
+
+@timed(DB_SECONDS)
 async def get_user_products(user_id: int) -> List[Product]:
     async with async_session() as session:
         result = await session.execute(
@@ -50,11 +146,13 @@ async def get_user_products(user_id: int) -> List[Product]:
         return result.scalars().all()
 
 
+@timed(DB_SECONDS)
 async def get_product(product_id: int) -> Optional[Product]:
     async with async_session() as session:
         return await session.scalar(select(Product).where(Product.id == product_id))
 
 
+@timed(DB_SECONDS)
 async def update_product_price(product_id: int, new_price: float) -> Optional[Product]:
     async with async_session() as session:
         product = await session.scalar(select(Product).where(Product.id == product_id))
@@ -66,6 +164,36 @@ async def update_product_price(product_id: int, new_price: float) -> Optional[Pr
         return product
 
 
+@timed(DB_SECONDS)
+async def update_product_prices(prices: Dict[int, float], chunk_size: int = 500) -> List[Product]:
+    """Обновляет цены многих товаров одной транзакцией: {product_id: new_price}.
+
+    Предыдущая цена берется из текущей прямо в UPDATE. Возвращает обновленные товары
+    для отправки уведомлений.
+    """
+    if not prices:
+        return []
+    table = Product.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam('b_id'))
+        .values(previous_price=table.c.current_price, current_price=bindparam('b_price'))
+    )
+    product_ids = list(prices)
+    async with async_session() as session:
+        await session.execute(stmt, [{'b_id': product_id, 'b_price': price} for product_id, price in prices.items()])
+        await session.commit()
+
+        updated = []
+        for i in range(0, len(product_ids), chunk_size):
+            result = await session.execute(
+                select(Product).where(Product.id.in_(product_ids[i:i + chunk_size]))
+            )
+            updated.extend(result.scalars().all())
+        return updated
+
+
+@timed(DB_SECONDS)
 async def delete_product(product_id: int, user_id: int) -> bool:
     async with async_session() as session:
         product = await session.scalar(
@@ -78,10 +206,333 @@ async def delete_product(product_id: int, user_id: int) -> bool:
         return False
 
 
+@timed(DB_SECONDS)
 async def get_products_for_price_check() -> List[Product]:
     """Получает все активные товары для проверки цен"""
     async with async_session() as session:
         result = await session.execute(
             select(Product).where(Product.is_active == True)
         )
-        return result.scalars().all()
\ No newline at end of file
+        return result.scalars().all()
+
+
+async def iter_products_for_price_check(article_ids: Optional[List[str]] = None, page_size: int = 1000,
+                                        chunk_size: int = 500) -> AsyncIterator:
+    """Потоково отдает активные товары для проверки цен, упорядоченные по (article_id, id).
+
+    Читает страницами по page_size с keyset-пагинацией и только нужные трекеру колонки,
+    поэтому память не растет с числом товаров. Товары одного артикула идут подряд.
+    """
+    columns = (Product.id, Product.user_id, Product.article_id, Product.current_price, Product.price_threshold)
+    if article_ids is None:
+        filters = [None]
+    else:
+        filters = [article_ids[i:i + chunk_size] for i in range(0, len(article_ids), chunk_size)]
+    for chunk in filters:
+        last_key = None
+        while True:
+            stmt = select(*columns).where(Product.is_active == True, Product.article_id != None)
+            if chunk is not None:
+                stmt = stmt.where(Product.article_id.in_(chunk))
+            if last_key is not None:
+                stmt = stmt.where(tuple_(Product.article_id, Product.id) > last_key)
+            stmt = stmt.order_by(Product.article_id, Product.id).limit(page_size)
+            async with async_session() as session:
+                rows = (await session.execute(stmt)).all()
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                break
+            last_key = (rows[-1].article_id, rows[-1].id)
+
+
+@timed(DB_SECONDS)
+async def get_max_product_id() -> int:
+    """Наибольший id товара (0, если товаров нет): граница для инкрементального чтения новых товаров"""
+    async with async_session() as session:
+        return (await session.scalar(select(func.max(Product.id)))) or 0
+
+
+@timed(DB_SECONDS)
+async def get_products_without_article_id(after_id: int = 0, until_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    """Возвращает (id, url) активных товаров с after_id < id <= until_id, для которых еще не сохранен артикул"""
+    stmt = select(Product.id, Product.url).where(
+        Product.is_active == True, Product.article_id == None, Product.id > after_id
+    )
+    if until_id is not None:
+        stmt = stmt.where(Product.id <= until_id)
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return [tuple(row) for row in result.all()]
+
+
+@timed(DB_SECONDS)
+async def set_product_article_ids(article_ids: Dict[int, str]):
+    """Сохраняет артикулы товаров одним запросом: {product_id: article_id}"""
+    if not article_ids:
+        return
+    table = Product.__table__
+    async with async_session() as session:
+        await session.execute(
+            update(table).where(table.c.id == bindparam('b_id')).values(article_id=bindparam('b_article_id')),
+            [{'b_id': product_id, 'b_article_id': article_id} for product_id, article_id in article_ids.items()]
+        )
+        await session.commit()
+
+
+# Кэш источников цены по артикулам
+@timed(DB_SECONDS)
+async def get_article_sources(max_age: float) -> Dict[str, Tuple[str, Optional[str], float]]:
+    """Возвращает не устаревшие записи кэша источников: {article_id: (source, basket_host, timestamp)}"""
+    since = datetime.datetime.now() - datetime.timedelta(seconds=max_age)
+    async with async_session() as session:
+        result = await session.execute(
+            select(Article.article_id, Article.source, Article.basket_host, Article.resolved_at)
+            .where(Article.source != None, Article.resolved_at >= since)
+        )
+        return {
+            article_id: (source, basket_host, resolved_at.timestamp())
+            for article_id, source, basket_host, resolved_at in result.all()
+        }
+
+
+@timed(DB_SECONDS)
+async def save_article_sources(sources: Dict[str, Tuple[str, Optional[str], float]]):
+    """Сохраняет изменившиеся записи кэша источников одной транзакцией"""
+    if not sources:
+        return
+    rows = [
+        {
+            'article_id': article_id,
+            'source': source,
+            'basket_host': basket_host,
+            'resolved_at': datetime.datetime.fromtimestamp(resolved_at),
+        }
+        for article_id, (source, basket_host, resolved_at) in sources.items()
+    ]
+    stmt = sqlite_insert(Article)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Article.article_id],
+        set_={
+            'source': stmt.excluded.source,
+            'basket_host': stmt.excluded.basket_host,
+            'resolved_at': stmt.excluded.resolved_at,
+        }
+    )
+    async with async_session() as session:
+        await session.execute(stmt, rows)
+        await session.commit()
+
+
+# Расписание проверок по артикулам
+@timed(DB_SECONDS)
+async def get_article_schedules(after_id: int = 0, until_id: Optional[int] = None
+                                ) -> Dict[str, Tuple[Optional[float], Optional[datetime.datetime]]]:
+    """Возвращает расписание отслеживаемых артикулов: {article_id: (check_interval, next_check_at)}.
+
+    after_id / until_id ограничивают выборку товарами after_id < id <= until_id (новые товары).
+    """
+    stmt = (
+        select(Product.article_id, Article.check_interval, Article.next_check_at)
+        .distinct()
+        .outerjoin(Article, Article.article_id == Product.article_id)
+        .where(Product.is_active == True, Product.article_id != None, Product.id > after_id)
+    )
+    if until_id is not None:
+        stmt = stmt.where(Product.id <= until_id)
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        return {article_id: (interval, next_check_at) for article_id, interval, next_check_at in result.all()}
+
+
+@timed(DB_SECONDS)
+async def save_article_schedules(schedules: Dict[str, Tuple[float, datetime.datetime]]):
+    """Сохраняет расписание артикулов одной транзакцией: {article_id: (check_interval, next_check_at)}"""
+    if not schedules:
+        return
+    rows = [
+        {'article_id': article_id, 'check_interval': interval, 'next_check_at': next_check_at}
+        for article_id, (interval, next_check_at) in schedules.items()
+    ]
+    stmt = sqlite_insert(Article)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Article.article_id],
+        set_={
+            'check_interval': stmt.excluded.check_interval,
+            'next_check_at': stmt.excluded.next_check_at,
+        }
+    )
+    async with async_session() as session:
+        await session.execute(stmt, rows)
+        await session.commit()
+
+
+# История цен
+@timed(DB_SECONDS)
+async def add_price_history(prices: Dict[str, float], chunk_size: int = 500) -> int:
+    """Записывает цены артикулов одной транзакцией, пропуская те, что не изменились с прошлой записи.
+
+    Возвращает число добавленных строк.
+    """
+    if not prices:
+        return 0
+    cents = {article_id: int(round(price * 100)) for article_id, price in prices.items()}
+    article_ids = list(cents)
+    async with async_session() as session:
+        last_prices = {}
+        for i in range(0, len(article_ids), chunk_size):
+            last_ids = (
+                select(func.max(PriceHistory.id))
+                .where(PriceHistory.article_id.in_(article_ids[i:i + chunk_size]))
+                .group_by(PriceHistory.article_id)
+            )
+            result = await session.execute(
+                select(PriceHistory.article_id, PriceHistory.price_cents).where(PriceHistory.id.in_(last_ids))
+            )
+            last_prices.update(result.all())
+
+        now = datetime.datetime.now()
+        rows = [
+            {'article_id': article_id, 'price_cents': price_cents, 'created_at': now}
+            for article_id, price_cents in cents.items()
+            if last_prices.get(article_id) != price_cents
+        ]
+        if rows:
+            await session.execute(insert(PriceHistory), rows)
+            await session.commit()
+        return len(rows)
+
+
+@timed(DB_SECONDS)
+async def get_price_history(article_id: str, since: datetime.datetime,
+                            until: Optional[datetime.datetime] = None) -> List[Tuple[datetime.datetime, float]]:
+    """Возвращает изменения цены артикула за период: [(время, цена), ...]"""
+    until = until or datetime.datetime.now()
+    async with async_session() as session:
+        result = await session.execute(
+            select(PriceHistory.created_at, PriceHistory.price_cents)
+            .where(PriceHistory.article_id == article_id,
+                   PriceHistory.created_at >= since,
+                   PriceHistory.created_at <= until)
+            .order_by(PriceHistory.created_at)
+        )
+        return [(created_at, price_cents / 100.0) for created_at, price_cents in result.all()]
+
+
+@timed(DB_SECONDS)
+async def get_price_stats(article_id: str, since: datetime.datetime,
+                          until: Optional[datetime.datetime] = None) -> Optional[Dict[str, float]]:
+    """Минимальная, максимальная и средняя цена артикула за период.
+
+    Так как хранятся только изменения, учитывается и цена, действовавшая на начало периода.
+    Среднее взвешено по времени: каждая цена входит в него с весом того, сколько она держалась
+    в пределах [since, until], поэтому часовая распродажа не весит столько же, сколько цена за месяц.
+    """
+    until = until or datetime.datetime.now()
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(PriceHistory.created_at, PriceHistory.price_cents)
+            .where(PriceHistory.article_id == article_id,
+                   PriceHistory.created_at >= since,
+                   PriceHistory.created_at <= until)
+            .order_by(PriceHistory.created_at, PriceHistory.id)
+        )).all()
+        opening = await session.scalar(
+            select(PriceHistory.price_cents)
+            .where(PriceHistory.article_id == article_id, PriceHistory.created_at < since)
+            .order_by(PriceHistory.created_at.desc())
+            .limit(1)
+        )
+
+    points = [(created_at, cents) for created_at, cents in rows]
+    if opening is not None:
+        points.insert(0, (since, opening))
+    if not points:
+        return None
+    # Цена points[i] действует до следующего изменения, последняя — до конца периода
+    weighted, duration = 0.0, 0.0
+    for (started_at, cents), (ended_at, _) in zip(points, points[1:] + [(until, None)]):
+        seconds = (ended_at - started_at).total_seconds()
+        weighted += cents * seconds
+        duration += seconds
+    prices = [cents for _, cents in points]
+    avg_cents = weighted / duration if duration > 0 else prices[-1]
+    return {
+        'min': min(prices) / 100.0,
+        'max': max(prices) / 100.0,
+        'avg': avg_cents / 100.0,
+        'count': len(points),
+    }
+
+
+@timed(DB_SECONDS)
+async def heartbeat_tracker_worker(worker_id: str, partitions: int, lease_ttl: float) -> List[int]:
+    """Продлевает аренды воркера трекера и перераспределяет партиции между живыми воркерами.
+
+    Каждый воркер держит не больше ceil(partitions / живых воркеров) партиций: лишние отпускает,
+    недостающие забирает из свободных или истекших аренд. Возвращает партиции воркера.
+    """
+    now = datetime.datetime.now()
+    expires_at = now + datetime.timedelta(seconds=lease_ttl)
+    stale_before = now - datetime.timedelta(seconds=lease_ttl)
+    async with async_session() as session:
+        # Первой идет запись: транзакция сразу берет блокировку на запись,
+        # и воркеры перераспределяют аренды строго по очереди
+        stmt = sqlite_insert(TrackerWorker).values(worker_id=worker_id, heartbeat_at=now)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[TrackerWorker.worker_id], set_={'heartbeat_at': now}
+        ))
+        await session.execute(delete(TrackerWorker).where(TrackerWorker.heartbeat_at < stale_before))
+        await session.execute(
+            sqlite_insert(TrackerLease).on_conflict_do_nothing(),
+            [{'partition': partition} for partition in range(partitions)]
+        )
+        alive = await session.scalar(select(func.count()).select_from(TrackerWorker))
+        share = -(-partitions // max(alive, 1))
+
+        owned = list(await session.scalars(
+            select(TrackerLease.partition)
+            .where(TrackerLease.worker_id == worker_id, TrackerLease.partition < partitions)
+            .order_by(TrackerLease.partition)
+        ))
+        # Отпускаем лишние партиции, чтобы их забрали новые воркеры
+        released = owned[share:]
+        owned = owned[:share]
+        if released:
+            await session.execute(
+                update(TrackerLease)
+                .where(TrackerLease.partition.in_(released), TrackerLease.worker_id == worker_id)
+                .values(worker_id=None, expires_at=None)
+            )
+        await session.execute(
+            update(TrackerLease).where(TrackerLease.worker_id == worker_id).values(expires_at=expires_at)
+        )
+        if len(owned) < share:
+            free = await session.scalars(
+                select(TrackerLease.partition)
+                .where(TrackerLease.partition < partitions)
+                .where(or_(TrackerLease.worker_id == None, TrackerLease.expires_at < now))
+                .order_by(TrackerLease.partition)
+                .limit(share - len(owned))
+            )
+            claimed = list(free)
+            if claimed:
+                await session.execute(
+                    update(TrackerLease)
+                    .where(TrackerLease.partition.in_(claimed))
+                    .values(worker_id=worker_id, expires_at=expires_at)
+                )
+                owned.extend(claimed)
+        await session.commit()
+    return sorted(owned)
+
+
+@timed(DB_SECONDS)
+async def release_tracker_worker(worker_id: str):
+    """Отпускает аренды остановленного воркера, чтобы другие забрали партиции без ожидания"""
+    async with async_session() as session:
+        await session.execute(
+            update(TrackerLease).where(TrackerLease.worker_id == worker_id).values(worker_id=None, expires_at=None)
+        )
+        await session.execute(delete(TrackerWorker).where(TrackerWorker.worker_id == worker_id))
+        await session.commit()
@@ -1,13 +1,16 @@
 import os
 import re
+import time
 from aiogram import Router, types, F, Bot
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
 from app.handlers import keyb as kb
 import app.database.request as rq
-from app.service.price_parser import get_wildberries_price
+from app.service.price_parser import extract_wildberries_article
+from app.service.price_lookup import lookup_price, lookup_prices_bulk
 from app.service.price_tracker import PriceTracker
 
 
@@ -24,6 +27,17 @@ class ProductForm(StatesGroup):
     waiting_for_threshold = State()
 
 
+class ImportForm(StatesGroup):
+    waiting_for_items = State()
+
+
+# Массовый импорт: ограничения на файл и число товаров за раз
+IMPORT_MAX_ITEMS = int(os.getenv('WB_IMPORT_MAX_ITEMS', 500))
+IMPORT_MAX_FILE_BYTES = 1024 * 1024
+DEFAULT_THRESHOLD = 50.0
+URL_PATTERN = re.compile(r"https?://[^\s,;\"']+")
+
+
 @router.message(Command("start"))
 async def start_handler(message: types.Message, state: FSMContext, bot: Bot):
     await state.clear()
@@ -117,6 +131,12 @@ async def process_product_url(message: types.Message, state: FSMContext):
     """Обрабатывает URL товара"""
     url = message.text.strip()
     
+    # Несколько ссылок в одном сообщении — массовое добавление с порогом по умолчанию
+    if len(URL_PATTERN.findall(url)) > 1:
+        await state.clear()
+        await run_bulk_import(message, url, DEFAULT_THRESHOLD)
+        return
+
     # Проверяем, что это Wildberries URL
     if 'wildberries.ru' not in url and 'wb.ru' not in url:
         await message.answer("❌ Пожалуйста, отправьте ссылку на товар с Wildberries (wildberries.ru или wb.ru)")
@@ -125,18 +145,18 @@ async def process_product_url(message: types.Message, state: FSMContext):
     await message.answer("🔍 Получаю информацию о товаре...")
     
     try:
-        # Получаем информацию о товаре
-        product_info = await get_wildberries_price(url)
+        # Получаем информацию о товаре (свежая цена из кэша или запрос к WB)
+        product_info = await lookup_price(url)
         
-        if not product_info:
+        if not product_info or not product_info.name:
             await message.answer("❌ Не удалось получить информацию о товаре. Проверьте ссылку.")
             await state.clear()
             return
         
-        name, price = product_info
+        name, price = product_info.name, product_info.price
         
         # Сохраняем данные в состоянии
-        await state.update_data(url=url, name=name, price=price)
+        await state.update_data(url=url, name=name, price=price, article_id=extract_wildberries_article(url))
         
         await message.answer(
             f"📦 Товар: {name}\n"
@@ -177,7 +197,7 @@ async def process_threshold(message: types.Message, state: FSMContext):
     
     try:
         # Добавляем товар в базу
-        product = await rq.add_product(user.id, name, url, price, threshold)
+        product = await rq.add_product(user.id, name, url, price, threshold, user_data.get('article_id'))
         
         await message.answer(
             f"✅ Товар успешно добавлен!\n\n"
@@ -193,6 +213,132 @@ async def process_threshold(message: types.Message, state: FSMContext):
     await state.clear()
 
 
+def parse_import_items(text: str):
+    """Достает из текста или CSV пары (артикул, ссылка): ссылки WB в любом месте строки
+    или артикул в первой колонке строки без ссылок"""
+    items = {}
+    for line in text.splitlines():
+        urls = [url for url in URL_PATTERN.findall(line) if 'wildberries.ru' in url or 'wb.ru' in url]
+        if urls:
+            for url in urls:
+                article_id = extract_wildberries_article(url)
+                if article_id:
+                    items.setdefault(article_id, url)
+            continue
+        first = re.split(r"[,;\t]", line.strip(), 1)[0].strip().strip('"')
+        if first.isdigit() and len(first) >= 6:
+            article_id = str(int(first))
+            items.setdefault(article_id, f"https://www.wildberries.ru/catalog/{article_id}/detail.aspx")
+    return list(items.items())
+
+
+@router.message(Command("import"))
+async def import_start(message: types.Message, state: FSMContext, command: CommandObject):
+    """Начинает массовое добавление товаров: /import [порог]"""
+    await state.clear()
+    threshold = DEFAULT_THRESHOLD
+    if command.args:
+        try:
+            threshold = float(command.args.strip().replace(',', '.'))
+        except ValueError:
+            threshold = 0
+        if threshold <= 0:
+            await message.answer("❌ Используйте: /import [порог в рублях], порог больше 0")
+            return
+    await state.update_data(threshold=threshold)
+    await message.answer(
+        f"📥 Отправьте ссылки на товары Wildberries (по одной в строке) "
+        f"или файл .txt / .csv со ссылками или артикулами.\n"
+        f"Порог уведомлений для всех товаров: {threshold:g} ₽. Не больше {IMPORT_MAX_ITEMS} товаров за раз."
+    )
+    await state.set_state(ImportForm.waiting_for_items)
+
+
+@router.message(ImportForm.waiting_for_items)
+async def process_import(message: types.Message, state: FSMContext, bot: Bot):
+    """Принимает список ссылок текстом или файлом"""
+    if message.document:
+        if message.document.file_size and message.document.file_size > IMPORT_MAX_FILE_BYTES:
+            await message.answer("❌ Файл слишком большой, максимум 1 МБ.")
+            return
+        content = (await bot.download(message.document)).read()
+        try:
+            text = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = content.decode('cp1251', errors='replace')
+    elif message.text:
+        text = message.text
+    else:
+        await message.answer("❌ Отправьте ссылки текстом или файлом .txt / .csv")
+        return
+
+    user_data = await state.get_data()
+    await state.clear()
+    await run_bulk_import(message, text, user_data.get('threshold', DEFAULT_THRESHOLD))
+
+
+async def run_bulk_import(message: types.Message, text: str, threshold: float):
+    """Находит цены всех товаров из текста, добавляет их одной транзакцией и отвечает сводкой"""
+    user = await rq.get_user(message.from_user.id)
+    if not user:
+        await message.answer("❌ Пользователь не найден. Зарегистрируйтесь снова.")
+        return
+
+    items = parse_import_items(text)
+    if not items:
+        await message.answer("❌ Не нашел ссылок на товары Wildberries или артикулов.")
+        return
+    truncated = max(0, len(items) - IMPORT_MAX_ITEMS)
+    items = items[:IMPORT_MAX_ITEMS]
+
+    # Товары, которые пользователь уже отслеживает, пропускаем
+    tracked = {
+        product.article_id or extract_wildberries_article(product.url)
+        for product in await rq.get_user_products(user.id)
+    }
+    new_items = [(article_id, url) for article_id, url in items if article_id not in tracked]
+    skipped = len(items) - len(new_items)
+
+    status = await message.answer(f"⏳ Импорт: получаю цены 0 из {len(new_items)}...")
+    last_update = time.monotonic()
+
+    async def progress(done: int, total: int):
+        nonlocal last_update
+        # Редактируем сообщение не чаще раза в 2 секунды
+        if time.monotonic() - last_update < 2:
+            return
+        last_update = time.monotonic()
+        try:
+            await status.edit_text(f"⏳ Импорт: получаю цены {done} из {total}...")
+        except TelegramBadRequest:
+            pass
+
+    found = await lookup_prices_bulk([article_id for article_id, _ in new_items], progress)
+    rows = [
+        (found[article_id][0], url, found[article_id][1], article_id)
+        for article_id, url in new_items if article_id in found
+    ]
+    failed = [article_id for article_id, _ in new_items if article_id not in found]
+    try:
+        added = await rq.add_products_bulk(user.id, rows, threshold)
+    except Exception as e:
+        await status.edit_text(f"❌ Ошибка при добавлении товаров: {e}")
+        return
+
+    summary = f"✅ Импорт завершен\n\n➕ Добавлено: {added}\n"
+    if skipped:
+        summary += f"⏭ Уже отслеживаются: {skipped}\n"
+    if truncated:
+        summary += f"✂️ Не обработано сверх лимита: {truncated}\n"
+    if failed:
+        summary += f"❌ Не удалось получить цену: {len(failed)}\n" + ", ".join(failed[:30])
+        if len(failed) > 30:
+            summary += f" и еще {len(failed) - 30}"
+        summary += "\n"
+    summary += f"\n🔔 Порог уведомлений: {threshold:g} ₽"
+    await status.edit_text(summary)
+
+
 @router.message(Command("list"))
 async def list_products(message: types.Message):
     """Показывает список отслеживаемых товаров"""
@@ -250,14 +396,14 @@ async def check_price_command(message: types.Message):
         
         await message.answer("🔍 Проверяю цену...")
         
-        # Проверяем цену
-        new_price = await get_wildberries_price(product.url)
+        # Проверяем цену: недавно полученная трекером берется из кэша без запроса к WB
+        new_price = await lookup_price(product.url)
         
         if new_price is None:
             await message.answer("❌ Не удалось получить текущую цену товара.")
             return
         
-        name, current_price = new_price
+        name, current_price = new_price.name or product.name, new_price.price
         
         # Обновляем цену в базе
         await rq.update_product_price(product.id, current_price)
@@ -278,6 +424,7 @@ async def check_price_command(message: types.Message):
             f"💰 Текущая цена: {current_price:.2f} ₽\n"
             f"💰 Предыдущая цена: {product.current_price:.2f} ₽\n"
             f"{change_text}"
+            + (f"\n🕒 Проверено {int(new_price.age // 60)} мин назад" if new_price.cached else "")
         )
         
     except ValueError:
@@ -327,6 +474,23 @@ async def delete_product_command(message: types.Message):
         await message.answer(f"❌ Ошибка при удалении товара: {e}")
 
 
+@router.message(Command("digest"))
+async def digest_command(message: types.Message):
+    """Включает/выключает уведомления одной сводкой"""
+    user = await rq.get_user(message.from_user.id)
+    if not user:
+        await message.answer("❌ Пользователь не найден.")
+        return
+
+    enabled = not user.digest_mode
+    await rq.set_user_digest_mode(message.from_user.id, enabled)
+
+    if enabled:
+        await message.answer("✅ Режим сводки включен: изменения цен нескольких товаров придут одним сообщением.")
+    else:
+        await message.answer("✅ Режим сводки выключен: уведомление придет по каждому товару отдельно.")
+
+
 @router.message(Command("help"))
 async def help_command(message: types.Message):
     """Показывает справку по командам"""
@@ -336,9 +500,11 @@ async def help_command(message: types.Message):
 📋 Доступные команды:
 
 /add - Добавить товар для отслеживания
+/import [порог] - Добавить сразу много товаров (список ссылок или файл)
 /list - Показать список отслеживаемых товаров
 /check <номер> - Проверить цену товара
 /delete <номер> - Удалить товар из отслеживания
+/digest - Включить/выключить уведомления одной сводкой
 /help - Показать эту справку
 
 💡 Как использовать:
@@ -347,7 +513,7 @@ async def help_command(message: types.Message):
 3. Бот будет отслеживать изменения цены и уведомит вас при изменении на указанную сумму
 
 🔔 Уведомления:
-Бот автоматически проверяет цены каждые 30 минут и отправляет уведомления при значительных изменениях.
+Бот автоматически проверяет цены (чаще, если цена товара часто меняется) и отправляет уведомления при значительных изменениях.
 """
     await message.answer(help_text)
 
@@ -0,0 +1,94 @@
+import os
+import time
+from collections import deque
+
+
+# Параметры circuit breaker для источников WB
+BREAKER_ERROR_RATE = float(os.getenv('WB_BREAKER_ERROR_RATE', 0.5))  # доля ошибок (EWMA), при которой источник выключается
+BREAKER_MIN_REQUESTS = int(os.getenv('WB_BREAKER_MIN_REQUESTS', 10))
+BREAKER_COOLDOWN = float(os.getenv('WB_BREAKER_COOLDOWN', 60))  # сек до пробного запроса
+EWMA_ALPHA = 0.2
+
+
+class EndpointHealth:
+    """Здоровье семейства эндпоинтов (v2 / v1 / basket): EWMA ошибок и задержек, circuit breaker.
+
+    closed — запросы идут как обычно; open — источник пропускается, пока не истечет cooldown;
+    half_open — пропускается один пробный запрос: успех закрывает breaker, ошибка снова открывает.
+    """
+
+    def __init__(self, name: str, error_threshold: float = BREAKER_ERROR_RATE,
+                 min_requests: int = BREAKER_MIN_REQUESTS, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.error_rate = 0.0
+        self.latency = None
+        self.requests = 0
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies = deque(maxlen=200)
+
+    def allow_request(self) -> bool:
+        if self.state == 'closed':
+            return True
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def is_available(self) -> bool:
+        """Можно ли сейчас обращаться к источнику (без резервирования пробного запроса)"""
+        if self.state == 'open':
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not (self.state == 'half_open' and self._probe_in_flight)
+
+    def release_probe(self):
+        """Снимает резерв пробного запроса, если он был отменен до ответа"""
+        if self.state == 'half_open':
+            self._probe_in_flight = False
+
+    def record(self, success: bool, latency: float):
+        self.requests += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if success else 1.0) - self.error_rate)
+        if success:
+            self.latency = latency if self.latency is None else self.latency + EWMA_ALPHA * (latency - self.latency)
+            self._latencies.append(latency)
+
+        if self.state == 'half_open':
+            self._probe_in_flight = False
+            if success:
+                self.state = 'closed'
+                self.error_rate = 0.0
+            else:
+                self._open()
+        elif (self.state == 'closed' and not success and self.requests >= self.min_requests
+              and self.error_rate >= self.error_threshold):
+            self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        print(f"Источник WB {self.name} временно отключен (ошибок: {self.error_rate:.0%})")
+
+    def percentile(self, q: float, default: float) -> float:
+        if len(self._latencies) < 10:
+            return default
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'error_rate': round(self.error_rate, 3),
+            'latency': self.latency,
+            'p95': self.percentile(0.95, None),
+            'requests': self.requests,
+        }
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class CacheEntry:
+    __slots__ = ('body', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, body: str, etag: Optional[str], last_modified: Optional[str], expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        """Заголовки условного запроса для ревалидации записи"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """LRU-кэш HTTP-ответов, ограниченный суммарным размером тел, с сохранением на диск"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def store(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str], ttl: float):
+        self._remove(url)
+        if len(body) > self.max_bytes:
+            return
+        self._entries[url] = CacheEntry(body, etag, last_modified, time.time() + ttl)
+        self._size += len(body)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+
+    def refresh(self, url: str, ttl: float):
+        """Продлевает запись после ответа 304 Not Modified"""
+        entry = self._entries.get(url)
+        if entry is not None:
+            entry.expires_at = time.time() + ttl
+            self.revalidated += 1
+
+    def _remove(self, url: str):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            for url, (body, etag, last_modified, expires_at) in data.items():
+                self._entries[url] = CacheEntry(body, etag, last_modified, expires_at)
+                self._size += len(body)
+        except Exception as e:
+            print(f"Не удалось загрузить HTTP-кэш из {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            data = {
+                url: [entry.body, entry.etag, entry.last_modified, entry.expires_at]
+                for url, entry in self._entries.items()
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Не удалось сохранить HTTP-кэш в {self.path}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+        }
@@ -0,0 +1,161 @@
+import os
+import time
+import bisect
+import inspect
+import functools
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+
+
+# Метрики в формате Prometheus: включаются заданием порта, например WB_METRICS_PORT=9100.
+# Без него методы метрик сразу возвращаются, а декоратор timed() не оборачивает функции.
+METRICS_PORT = int(os.getenv('WB_METRICS_PORT', 0))
+METRICS_HOST = os.getenv('WB_METRICS_HOST', '127.0.0.1')
+enabled = METRICS_PORT > 0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List["Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class _ValueMetric(Metric):
+    """Метрика с одним значением на набор меток. set_function() задает функцию, которая
+    вычисляет значение при каждом чтении метрик (например, счетчики, которые уже ведет кэш)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], *labels: str):
+        self._functions[labels] = function
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        for labels, function in self._functions.items():
+            try:
+                values[labels] = function()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+                for labels, value in values.items() if value is not None]
+
+
+class Counter(_ValueMetric):
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1):
+        if not enabled:
+            return
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_ValueMetric):
+    kind = 'gauge'
+
+    def set(self, value: float, *labels: str):
+        if not enabled:
+            return
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        if not enabled:
+            return
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def timed(histogram: Histogram, *labels: str):
+    """Декоратор корутины: время выполнения пишется в histogram. Без метрик функция не оборачивается"""
+    def decorator(function):
+        if not enabled or not inspect.iscoroutinefunction(function):
+            return function
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *(labels or (function.__name__,)))
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8',
+                        headers={'X-Content-Type-Options': 'nosniff'})
+
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[web.AppRunner]:
+    """Запускает HTTP-эндпоинт /metrics; None, если метрики выключены"""
+    if not enabled:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Метрики: http://{host}:{port}/metrics")
+    return runner
+
+
+async def stop_metrics_server(runner: Optional[web.AppRunner]):
+    if runner is not None:
+        await runner.cleanup()
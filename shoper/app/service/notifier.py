@@ -0,0 +1,209 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+from app.service.rate_limiter import TokenBucket
+from app.service.metrics import Gauge, Histogram
+
+
+# Ограничения Telegram: ~30 сообщений в секунду всего и ~1 в секунду в один чат
+NOTIFY_GLOBAL_RATE = float(os.getenv('WB_NOTIFY_GLOBAL_RATE', 25))
+NOTIFY_CHAT_RATE = float(os.getenv('WB_NOTIFY_CHAT_RATE', 1))
+NOTIFY_WORKERS = int(os.getenv('WB_NOTIFY_WORKERS', 4))
+NOTIFY_MAX_RETRIES = int(os.getenv('WB_NOTIFY_MAX_RETRIES', 5))
+# Окно сбора сводки (сек): 0 — сводка отправляется в конце каждого прохода трекера
+DIGEST_WINDOW = float(os.getenv('WB_DIGEST_WINDOW', 0))
+# Максимальная длина сообщения Telegram (4096) с запасом на эмодзи
+MAX_MESSAGE_LENGTH = 4000
+
+SEND_SECONDS = Histogram('wb_telegram_send_seconds', 'Задержка вызова sendMessage', ['result'])
+NOTIFY_LAG_SECONDS = Histogram('wb_notification_lag_seconds', 'Время от постановки уведомления в очередь до доставки',
+                               buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+QUEUE_DEPTH = Gauge('wb_notify_queue_depth', 'Уведомления в очереди на отправку')
+
+
+class OutgoingMessage:
+    __slots__ = ('text', 'attempts', 'created_at')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.attempts = 0
+        self.created_at = time.monotonic()
+
+
+class NotificationDispatcher:
+    """Очередь исходящих сообщений с учетом лимитов Telegram.
+
+    send() только ставит сообщение в очередь, доставкой занимаются фоновые воркеры.
+    Сообщения одного чата уходят по порядку, не чаще chat_rate в секунду,
+    все вместе — не чаще global_rate. TelegramRetryAfter откладывает чат на указанное
+    время, сетевые ошибки повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = NOTIFY_GLOBAL_RATE, chat_rate: float = NOTIFY_CHAT_RATE,
+                 workers: int = NOTIFY_WORKERS, max_retries: int = NOTIFY_MAX_RETRIES,
+                 digest_window: float = DIGEST_WINDOW):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.chat_rate = chat_rate
+        self.workers_count = max(1, workers)
+        self.max_retries = max_retries
+        self._pending: Dict[int, Deque[OutgoingMessage]] = {}
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # Чаты, у которых есть сообщения к отправке; каждый чат в очереди не более одного раза
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._timers = set()
+        # Сводки: чат -> накопленные изменения, отправляются одним сообщением
+        self.digest_window = digest_window
+        self._digests: Dict[int, List[str]] = {}
+        self._digest_timers = {}
+        QUEUE_DEPTH.set_function(lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(messages) for messages in self._pending.values())
+
+    def send(self, chat_id: int, text: str):
+        """Ставит сообщение в очередь на отправку, не дожидаясь доставки"""
+        messages = self._pending.get(chat_id)
+        if messages is None:
+            self._pending[chat_id] = deque([OutgoingMessage(text)])
+            self._ready.put_nowait(chat_id)
+        else:
+            messages.append(OutgoingMessage(text))
+
+    def add_to_digest(self, chat_id: int, text: str):
+        """Добавляет изменение в сводку чата вместо отдельного сообщения"""
+        items = self._digests.setdefault(chat_id, [])
+        items.append(text)
+        if self.digest_window > 0 and chat_id not in self._digest_timers:
+            self._digest_timers[chat_id] = asyncio.get_running_loop().call_later(
+                self.digest_window, self._flush_digest, chat_id
+            )
+
+    def flush_digests(self):
+        """Отправляет сводки, накопленные за проход трекера.
+
+        При ненулевом digest_window сводки уходят по своим таймерам, и вызов ничего не делает.
+        """
+        if self.digest_window > 0:
+            return
+        for chat_id in list(self._digests):
+            self._flush_digest(chat_id)
+
+    def _flush_digest(self, chat_id: int):
+        timer = self._digest_timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+        items = self._digests.pop(chat_id, None)
+        if not items:
+            return
+        if len(items) == 1:
+            self.send(chat_id, f"🔔 Изменение цены!\n\n{items[0]}")
+            return
+        # Делим сводку на сообщения не длиннее лимита Telegram по границам товаров
+        text = f"🔔 Изменение цен: {len(items)} товаров\n\n"
+        for item in items:
+            if len(text) + len(item) + 2 > MAX_MESSAGE_LENGTH:
+                self.send(chat_id, text.rstrip())
+                text = ""
+            text += item + "\n\n"
+        self.send(chat_id, text.rstrip())
+
+    async def start(self):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+
+    async def stop(self, drain_timeout: float = 10):
+        """Дожидается отправки очереди (не дольше drain_timeout) и останавливает воркеров"""
+        for chat_id in list(self._digests):
+            self._flush_digest(chat_id)
+        deadline = time.monotonic() + drain_timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._pending:
+            print(f"Не отправлено уведомлений: {self.queue_depth}")
+
+    def _requeue_later(self, chat_id: int, delay: float):
+        """Возвращает чат в очередь через delay секунд"""
+        def requeue():
+            self._timers.discard(timer)
+            self._ready.put_nowait(chat_id)
+
+        timer = asyncio.get_running_loop().call_later(delay, requeue)
+        self._timers.add(timer)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Выбрасываем полные корзины неактивных чатов
+                self._chat_buckets = {
+                    cid: b for cid, b in self._chat_buckets.items() if cid in self._pending or not b.is_idle()
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            messages = self._pending.get(chat_id)
+            if not messages:
+                self._pending.pop(chat_id, None)
+                continue
+
+            wait = self._chat_bucket(chat_id).try_acquire()
+            if wait > 0:
+                self._requeue_later(chat_id, wait)
+                continue
+
+            await self.global_bucket.acquire()
+            delay = await self._deliver(chat_id, messages[0])
+            if delay is None:
+                messages.popleft()
+                delay = 0
+            if messages:
+                if delay:
+                    self._requeue_later(chat_id, delay)
+                else:
+                    self._ready.put_nowait(chat_id)
+            else:
+                del self._pending[chat_id]
+
+    async def _deliver(self, chat_id: int, message: OutgoingMessage) -> Optional[float]:
+        """Отправляет сообщение. None — сообщение обработано, иначе через сколько секунд повторить"""
+        started = time.monotonic()
+        try:
+            await self.bot.send_message(chat_id, message.text)
+            SEND_SECONDS.observe(time.monotonic() - started, 'ok')
+            NOTIFY_LAG_SECONDS.observe(time.monotonic() - message.created_at)
+            return None
+        except TelegramRetryAfter as e:
+            # Flood control: Telegram сам говорит, сколько ждать; попыткой это не считаем
+            SEND_SECONDS.observe(time.monotonic() - started, 'retry_after')
+            return float(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            SEND_SECONDS.observe(time.monotonic() - started, 'error')
+            message.attempts += 1
+            if message.attempts > self.max_retries:
+                print(f"Не удалось отправить уведомление в чат {chat_id}: {e}")
+                return None
+            return min(2 ** message.attempts, 60)
+        except Exception as e:
+            # Пользователь заблокировал бота, чат не найден и т.п. — повтор не поможет
+            SEND_SECONDS.observe(time.monotonic() - started, 'failed')
+            print(f"Ошибка при отправке уведомления в чат {chat_id}: {e}")
+            return None
@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.database.price_cache import get_latest_price, set_latest_prices
+from app.service.price_parser import (
+    WildberriesPriceParser, extract_wildberries_article, get_wildberries_price, get_shared_parser, WB_BATCH_SIZE,
+)
+
+
+# Сколько секунд цена из кэша считается свежей для /check и /add
+PRICE_FRESHNESS = float(os.getenv('WB_PRICE_FRESHNESS', 300))
+# Сколько пачек артикулов массового импорта запрашивать параллельно
+BULK_LOOKUP_CONCURRENCY = int(os.getenv('WB_BULK_LOOKUP_CONCURRENCY', 4))
+
+
+class PriceLookup(NamedTuple):
+    name: Optional[str]
+    price: float
+    checked_at: float
+    cached: bool  # True — цена взята из кэша, а не запрошена сейчас
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.checked_at)
+
+
+async def lookup_price(url: str, max_age: float = PRICE_FRESHNESS) -> Optional[PriceLookup]:
+    """Цена товара: из кэша последних цен, если она не старше max_age, иначе запрос к WB.
+
+    Полученная цена попадает в кэш. Одновременные запросы одного артикула объединяет парсер.
+    """
+    article_id = extract_wildberries_article(url)
+    if article_id is None:
+        return None
+    cached = await get_latest_price(article_id)
+    if cached is not None and time.time() - cached.checked_at <= max_age:
+        return PriceLookup(cached.name, cached.price, cached.checked_at, True)
+
+    info = await get_wildberries_price(url)
+    if info is None:
+        return None
+    await set_latest_prices({article_id: info[1]}, {article_id: info[0]})
+    return PriceLookup(info[0], info[1], time.time(), False)
+
+
+async def lookup_prices_bulk(article_ids: List[str],
+                             progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+                             max_age: float = PRICE_FRESHNESS) -> Dict[str, Tuple[str, float]]:
+    """Названия и цены списка артикулов: свежие берутся из кэша, остальные — пачками через
+    cards/v2 параллельно, а не найденные в пачке — по цепочке источников без повторного v2.
+
+    progress(обработано, всего) вызывается после каждой пачки. Не найденных артикулов в результате нет.
+    """
+    article_ids = list(dict.fromkeys(article_ids))
+    total = len(article_ids)
+    results: Dict[str, Tuple[str, float]] = {}
+    missing = []
+    now = time.time()
+    for article_id in article_ids:
+        cached = await get_latest_price(article_id)
+        if cached is not None and cached.name and now - cached.checked_at <= max_age:
+            results[article_id] = (cached.name, cached.price)
+        else:
+            missing.append(article_id)
+
+    parser = get_shared_parser()
+    own_parser = parser is None
+    if own_parser:
+        parser = WildberriesPriceParser()
+        await parser.start()
+
+    done = total - len(missing)
+    semaphore = asyncio.Semaphore(max(1, BULK_LOOKUP_CONCURRENCY))
+
+    async def resolve(chunk: List[str]):
+        nonlocal done
+        async with semaphore:
+            found = await parser.get_prices_batch(chunk)
+            misses = [article_id for article_id in chunk if article_id not in found]
+            for article_id, info in zip(misses, await asyncio.gather(
+                    *(parser.get_product_info_by_id(article_id, skip=('v2',)) for article_id in misses))):
+                if info is not None:
+                    found[article_id] = info
+            fetched = {article_id: info for article_id, info in found.items() if article_id in chunk}
+            results.update(fetched)
+            await set_latest_prices({a: info[1] for a, info in fetched.items()},
+                                    {a: info[0] for a, info in fetched.items()})
+            done += len(chunk)
+            if progress:
+                await progress(done, total)
+
+    try:
+        chunks = [missing[i:i + WB_BATCH_SIZE] for i in range(0, len(missing), WB_BATCH_SIZE)]
+        await asyncio.gather(*(resolve(chunk) for chunk in chunks))
+    finally:
+        if own_parser:
+            await parser.close()
+    return results
@@ -1,59 +1,166 @@
 import os
 import re
+import json
+import bisect
 import aiohttp
 import asyncio
-from typing import Optional, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse, parse_qs
 
+from app.service.rate_limiter import TokenBucket
+from app.service.http_cache import HttpCache
+from app.service.endpoint_health import EndpointHealth
+from app.service.metrics import Counter, Gauge, Histogram
+from app.service.singleflight import SingleFlight
+from app.service.wb_decode import decode_card_products, loads
+
+
+# Лимит запросов к хостам WB для общего парсера
+WB_RATE_LIMIT = float(os.getenv('WB_RATE_LIMIT', 5))  # запросов в секунду
+WB_RATE_BURST = int(os.getenv('WB_RATE_BURST', 5))
+# Пул соединений общего парсера
+WB_HTTP_LIMIT = int(os.getenv('WB_HTTP_LIMIT', 100))
+WB_HTTP_LIMIT_PER_HOST = int(os.getenv('WB_HTTP_LIMIT_PER_HOST', 20))
+WB_KEEPALIVE_TIMEOUT = float(os.getenv('WB_KEEPALIVE_TIMEOUT', 60))
+WB_DNS_CACHE_TTL = int(os.getenv('WB_DNS_CACHE_TTL', 600))
+# Сколько артикулов запрашивать в одном обращении к cards/v2/detail
+WB_BATCH_SIZE = int(os.getenv('WB_BATCH_SIZE', 50))
+# Сколько секунд доверять запомненному источнику цены артикула
+WB_SOURCE_CACHE_TTL = int(os.getenv('WB_SOURCE_CACHE_TTL', 3 * 24 * 3600))
+# Базовые адреса API (переопределяются для локальной заглушки WB в benchmarks/bench_tracker.py)
+WB_CARD_BASE = os.getenv('WB_CARD_BASE', 'https://card.wb.ru')
+WB_BASKET_BASE = os.getenv('WB_BASKET_BASE', 'https://{host}')
+# Таблица vol -> basket и ширина параллельной пробы соседних шардов при промахе
+WB_BASKET_ROUTES_FILE = os.getenv('WB_BASKET_ROUTES', os.path.join(os.path.dirname(__file__), 'basket_routes.json'))
+WB_BASKET_PROBE_SPAN = int(os.getenv('WB_BASKET_PROBE_SPAN', 4))
+DEFAULT_BASKET_HOST = 'basket-{:02d}.wb.ru'
+# HTTP-кэш: время жизни ответа по типу запроса (сек), 0 — не кэшировать.
+# Цены (card.wb.ru) запрашиваются каждый раз. card.json с basket хранится в кэше, но из него тоже
+# берется цена, поэтому без запроса он не отдается: каждый раз уходит условный запрос (ETag /
+# If-Modified-Since), и тело из кэша используется только при ответе 304
+WB_CACHE_TTL = {
+    'price': float(os.getenv('WB_PRICE_CACHE_TTL', 0)),
+    'card': float(os.getenv('WB_CARD_CACHE_TTL', 6 * 3600)),
+}
+WB_CACHE_ALWAYS_REVALIDATE = {'card'}
+WB_HTTP_CACHE_MAX_BYTES = int(os.getenv('WB_HTTP_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+WB_HTTP_CACHE_FILE = os.getenv('WB_HTTP_CACHE_FILE')  # необязательное сохранение кэша на диск
+# Хеджирование: если источник не ответил за p95 своих задержек, параллельно запрашиваем следующий
+WB_HEDGE_REQUESTS = os.getenv('WB_HEDGE_REQUESTS', '0').lower() in ('1', 'true', 'yes')
+WB_HEDGE_DEFAULT_DELAY = float(os.getenv('WB_HEDGE_DEFAULT_DELAY', 2))  # пока нет статистики задержек
+WB_HEDGE_MIN_DELAY = float(os.getenv('WB_HEDGE_MIN_DELAY', 0.2))
+SOURCES = ('v2', 'v1', 'basket')
+
+FETCH_SECONDS = Histogram('wb_fetch_seconds', 'Задержка HTTP-запросов к WB по источникам', ['source'])
+FETCH_TOTAL = Counter('wb_fetch_total', 'HTTP-запросы к WB по источникам и результатам', ['source', 'result'])
+PRICE_SOURCE_TOTAL = Counter('wb_price_source_total', 'Цены, полученные через каждый источник', ['source'])
+HTTP_CACHE_TOTAL = Counter('wb_http_cache_total', 'Обращения к HTTP-кэшу ответов WB', ['result'])
+BREAKER_STATE = Gauge('wb_source_breaker_state', 'Состояние breaker источника: 0 closed, 1 half_open, 2 open', ['source'])
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+LOOKUP_CALLS = Counter('wb_product_lookups_total', 'Вызовы get_product_info_by_id: own — свой запрос, '
+                       'collapsed — дождались уже идущего запроса того же артикула', ['result'])
+
+# Где артикул встречается в ссылках WB
+PRODUCT_URL_PATTERNS = [re.compile(pattern) for pattern in (
+    r'/catalog/(\d+)/detail\.aspx',           # /catalog/93378993/detail.aspx
+    r'/catalog/(\d+)/?$',                      # /catalog/93378993
+    r'/catalog/(\d+)/(?:[^/]+/)*$',            # /catalog/93378993/<...>
+    r'/product/(\d+)/',                        # /product/93378993/
+    r'card/(\d+)',                             # ...card/93378993
+    r'(\d+)\.html',                            # .../93378993.html
+)]
+
+
+def load_basket_routes(path: str) -> Tuple[str, List[Tuple[int, int]]]:
+    """Читает таблицу маршрутизации basket из JSON: {"host": "...", "routes": [[max_vol, basket], ...]}"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        routes = sorted((int(max_vol), int(number)) for max_vol, number in config.get('routes', []))
+        return config.get('host') or DEFAULT_BASKET_HOST, routes
+    except Exception as e:
+        print(f"Не удалось загрузить таблицу basket из {path}: {e}")
+        return DEFAULT_BASKET_HOST, []
+
 
 class WildberriesPriceParser:
-    def __init__(self):
+    def __init__(self, rate_limiter: Optional[TokenBucket] = None,
+                 limit: int = WB_HTTP_LIMIT, limit_per_host: int = WB_HTTP_LIMIT_PER_HOST,
+                 basket_routes_file: str = WB_BASKET_ROUTES_FILE):
         self.session = None
+        # Общий лимит запросов к хостам WB (token bucket), если задан
+        self.rate_limiter = rate_limiter
+        self.limit = limit
+        self.limit_per_host = limit_per_host
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
             'Referer': 'https://www.wildberries.ru/'
         }
+        # Таблица маршрутизации basket: (максимальный vol, номер basket), по возрастанию vol
+        self.basket_host_template, self.basket_routes = load_basket_routes(basket_routes_file)
+        self.basket_route_vols = [max_vol for max_vol, _ in self.basket_routes]
+        self.card_base = WB_CARD_BASE
+        self.basket_base = WB_BASKET_BASE
+        self.http_cache = HttpCache(WB_HTTP_CACHE_MAX_BYTES, WB_HTTP_CACHE_FILE)
+        # Состояние семейств эндпоинтов WB: ошибки, задержки, circuit breaker
+        self.health: Dict[str, EndpointHealth] = {source: EndpointHealth(source) for source in SOURCES}
+        self.hedge_requests = WB_HEDGE_REQUESTS
+        # Одновременные запросы одного артикула (трекер, /add, /check) выполняются один раз
+        self._inflight = SingleFlight()
+        # Кэш источников: артикул -> (v2/v1/basket, хост basket, время последнего успеха)
+        self.sources: Dict[str, Tuple[str, Optional[str], float]] = {}
+        self._dirty_sources = set()
         # Опциональный прокси из окружения
         self.proxy_url = os.getenv('WB_PROXY_URL') or os.getenv('HTTP_PROXY') or os.getenv('HTTPS_PROXY')
 
-    async def __aenter__(self):
+    def bind_metrics(self):
+        """Делает счетчики этого парсера метриками процесса (только для общего парсера)"""
+        for source, health in self.health.items():
+            BREAKER_STATE.set_function(lambda health=health: BREAKER_STATES[health.state], source)
+        LOOKUP_CALLS.set_function(lambda: self._inflight.calls - self._inflight.collapsed, 'own')
+        LOOKUP_CALLS.set_function(lambda: self._inflight.collapsed, 'collapsed')
+        for result in ('hits', 'misses', 'revalidated'):
+            HTTP_CACHE_TOTAL.set_function(lambda result=result: getattr(self.http_cache, result), result)
+
+    async def start(self):
+        """Открывает HTTP-сессию с пулом keep-alive соединений"""
+        if self.session and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=WB_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=WB_DNS_CACHE_TTL,
+        )
         # trust_env=True позволит aiohttp использовать системные прокси, если они заданы
-        self.session = aiohttp.ClientSession(headers=self.headers, trust_env=True)
-        return self
+        self.session = aiohttp.ClientSession(headers=self.headers, connector=connector, trust_env=True)
+        self.http_cache.load()
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
+    async def close(self):
+        """Закрывает HTTP-сессию"""
+        # Общие запросы single-flight защищены от отмены ожидающими — отменяем их сами, до закрытия сессии
+        await self._inflight.cancel_all()
         if self.session:
             await self.session.close()
+            self.session = None
+            self.http_cache.save()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
     def extract_product_id(self, url: str) -> Optional[str]:
         """Извлекает ID товара из URL Wildberries"""
-        try:
-            # Если просто число
-            if url.isdigit():
-                return url
-
-            patterns = [
-                r'/catalog/(\d+)/detail\.aspx',           # /catalog/93378993/detail.aspx
-                r'/catalog/(\d+)/?$',                      # /catalog/93378993
-                r'/catalog/(\d+)/(?:[^/]+/)*$',            # /catalog/93378993/<...>
-                r'/product/(\d+)/',                        # /product/93378993/
-                r'card/(\d+)',                             # ...card/93378993
-                r'(\d+)\.html'                            # .../93378993.html
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, url)
-                if match:
-                    return match.group(1)
-            
-            parsed = urlparse(url)
-            query_params = parse_qs(parsed.query)
-            if 'nm' in query_params and len(query_params['nm']) > 0:
-                return query_params['nm'][0]
-            
-            return None
-        except Exception:
-            return None
+        return extract_wildberries_article(url)
+
+    @staticmethod
+    def normalize_product_id(product_id: str) -> Optional[str]:
+        """Приводит артикул к каноническому виду (без ведущих нулей), чтобы одинаковые товары совпадали"""
+        return normalize_article_id(product_id)
 
     def _calc_vol_part(self, product_id: int) -> Tuple[int, int]:
         # Формула для legacy basket JSON
@@ -61,96 +168,299 @@ class WildberriesPriceParser:
         part = product_id // 1000
         return vol, part
 
-    async def _http_get_json(self, url: str) -> Optional[dict]:
+    async def _http_get_json(self, url: str, kind: str = 'price', family: Optional[str] = None) -> Optional[dict]:
+        body = await self._http_get_text(url, kind, family)
+        if body is None:
+            return None
         try:
-            async with self.session.get(url, proxy=self.proxy_url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+            return loads(body)
+        except ValueError:
+            return None
+
+    async def _http_get_text(self, url: str, kind: str = 'price', family: Optional[str] = None) -> Optional[str]:
+        ttl = WB_CACHE_TTL.get(kind, 0)
+        entry = self.http_cache.get(url) if ttl > 0 else None
+        if entry is not None and entry.is_fresh() and kind not in WB_CACHE_ALWAYS_REVALIDATE:
+            self.http_cache.hits += 1
+            return entry.body
+        if ttl > 0:
+            self.http_cache.misses += 1
+
+        # Источник с открытым breaker не опрашиваем, пока не истечет его cooldown
+        health = self.health.get(family)
+        source = family or kind
+        if health is not None and not health.allow_request():
+            FETCH_TOTAL.inc(source, 'breaker_open')
+            return None
+        started = time.monotonic()
+        try:
+            # Ожидание токена тоже внутри try: отмена в нем должна снять резерв пробного запроса
+            if self.rate_limiter:
+                await self.rate_limiter.acquire()
+                started = time.monotonic()
+            # Запись из кэша ревалидируем условным запросом (ETag / Last-Modified)
+            headers = entry.validators() if entry is not None else None
+            async with self.session.get(url, proxy=self.proxy_url, headers=headers,
+                                        timeout=aiohttp.ClientTimeout(total=15)) as response:
+                elapsed = time.monotonic() - started
+                FETCH_SECONDS.observe(elapsed, source)
+                FETCH_TOTAL.inc(source, str(response.status))
+                # 429 и 5xx — проблема источника; 404 и прочие ответы считаем здоровыми
+                if health is not None:
+                    health.record(response.status != 429 and response.status < 500, elapsed)
+                if response.status == 304 and entry is not None:
+                    self.http_cache.refresh(url, ttl)
+                    return entry.body
                 if response.status != 200:
                     return None
-                return await response.json(content_type=None)
+                body = await response.text()
+                if ttl > 0:
+                    self.http_cache.store(url, body, response.headers.get('ETag'),
+                                          response.headers.get('Last-Modified'), ttl)
+                return body
+        except asyncio.CancelledError:
+            # Запрос отменен (хеджирование, остановка) — на здоровье источника не влияет
+            if health is not None:
+                health.release_probe()
+            raise
         except Exception:
+            FETCH_TOTAL.inc(source, 'error')
+            if health is not None:
+                health.record(False, time.monotonic() - started)
             return None
 
-    async def _try_cards_v2(self, product_id: str) -> Optional[Tuple[str, float]]:
+    async def _try_cards_v2_batch(self, product_ids: List[str]) -> Dict[str, Tuple[str, float]]:
+        """Запрашивает cards/v2/detail сразу для нескольких артикулов (nm=1;2;3)"""
+        nm = ';'.join(product_ids)
         api_url = (
-            f"https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest=-1257786&spp=0&nm={product_id}"
+            f"{self.card_base}/cards/v2/detail?appType=1&curr=rub&dest=-1257786&spp=0&nm={nm}"
         )
-        data = await self._http_get_json(api_url)
-        if not data:
-            return None
-        products = data.get('data', {}).get('products', [])
-        if not products:
-            return None
-        product = products[0]
-        name = product.get('name') or 'Неизвестный товар'
-        price_cents = None
-        if isinstance(product.get('salePriceU'), (int, float)):
-            price_cents = product['salePriceU']
-        elif isinstance(product.get('priceU'), (int, float)):
-            price_cents = product['priceU']
-        else:
-            if 'sizes' in product and product['sizes']:
-                for size in product['sizes']:
-                    price_obj = size.get('price') or {}
-                    if 'product' in price_obj:
-                        price_cents = price_obj['product']
-                        break
-        if price_cents is None:
-            return None
-        return name, float(price_cents) / 100.0
+        body = await self._http_get_text(api_url, family='v2')
+        if not body:
+            return {}
+        results = {}
+        try:
+            records = decode_card_products(body)
+        except ValueError:
+            return {}
+        for record in records:
+            if not record.article_id:
+                continue
+            results[record.article_id] = (record.name, record.price)
+            self._remember_source(record.article_id, 'v2')
+        return results
+
+    async def _try_cards_v2(self, product_id: str) -> Optional[Tuple[str, float]]:
+        results = await self._try_cards_v2_batch([product_id])
+        return results.get(product_id)
 
     async def _try_cards_v1(self, product_id: str) -> Optional[Tuple[str, float]]:
-        api_url = f"https://card.wb.ru/cards/detail?nm={product_id}"
-        data = await self._http_get_json(api_url)
-        if not data:
+        api_url = f"{self.card_base}/cards/detail?nm={product_id}"
+        body = await self._http_get_text(api_url, family='v1')
+        if not body:
+            return None
+        try:
+            # В ответе v1 цена берется только из размеров
+            records = decode_card_products(body, sizes_only=True)
+        except ValueError:
+            return None
+        if not records:
             return None
-        products = data.get('data', {}).get('products', [])
-        if not products:
+        self._remember_source(product_id, 'v1')
+        return records[0].name, records[0].price
+
+    def _parse_basket_card(self, data: dict) -> Optional[Tuple[str, float]]:
+        name = data.get('imt_name') or data.get('subj_name') or 'Неизвестный товар'
+        # Цена в копейках
+        price_cents = data.get('salePriceU') or data.get('priceU')
+        if isinstance(price_cents, (int, float)):
+            return name, float(price_cents) / 100.0
+        # Альтернативные поля
+        if isinstance(data.get('price'), (int, float)):
+            return name, float(data['price']) / 100.0
+        return None
+
+    def _basket_number(self, vol: int) -> Optional[int]:
+        """Номер basket-шарда по таблице маршрутизации vol -> basket, None если vol за ее пределами"""
+        index = bisect.bisect_left(self.basket_route_vols, vol)
+        if index >= len(self.basket_routes):
             return None
-        product = products[0]
-        name = product.get('name') or 'Неизвестный товар'
-        price = None
-        if 'sizes' in product and product['sizes']:
-            for size in product['sizes']:
-                price_obj = size.get('price') or {}
-                if 'product' in price_obj:
-                    price = price_obj['product'] / 100.0
-                    break
-        if price is None:
+        return self.basket_routes[index][1]
+
+    def _basket_candidates(self, number: int) -> List[str]:
+        """Соседние шарды для параллельной пробы, когда таблица не помогла"""
+        numbers = [number + i for i in range(1, WB_BASKET_PROBE_SPAN + 1)] + [number, number - 1, number - 2]
+        return [self.basket_host_template.format(n) for n in numbers if n >= 1]
+
+    async def _fetch_basket_host(self, product_id: str, host: str) -> Optional[Tuple[str, float]]:
+        pid = int(product_id)
+        vol, part = self._calc_vol_part(pid)
+        base = self.basket_base.format(host=host)
+        data = await self._http_get_json(f"{base}/vol{vol}/part{part}/{pid}/info/ru/card.json", 'card', 'basket')
+        if not data:
             return None
-        return name, price
+        result = self._parse_basket_card(data)
+        if result:
+            self._remember_source(product_id, 'basket', host)
+        return result
+
+    async def _probe_basket_hosts(self, product_id: str, hosts: List[str]) -> Optional[Tuple[str, float]]:
+        """Опрашивает несколько basket-хостов параллельно и возвращает первый успешный ответ"""
+        tasks = [asyncio.create_task(self._fetch_basket_host(product_id, host)) for host in hosts]
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                if result:
+                    return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
 
     async def _try_basket_json(self, product_id: str) -> Optional[Tuple[str, float]]:
         try:
             pid = int(product_id)
         except ValueError:
             return None
-        vol, part = self._calc_vol_part(pid)
-        # basket-0..31 – обычно достаточно 01..32, попробуем несколько
-        for i in range(1, 6):
-            host = f"https://basket-{i:02d}.wb.ru/vol{vol}/part{part}/{pid}/info/ru/card.json"
-            data = await self._http_get_json(host)
-            if not data:
-                continue
-            name = data.get('imt_name') or data.get('subj_name') or 'Неизвестный товар'
-            # Цена в копейках
-            price_cents = data.get('salePriceU') or data.get('priceU')
-            if isinstance(price_cents, (int, float)):
-                return name, float(price_cents) / 100.0
-            # Альтернативные поля
-            if isinstance(data.get('price'), (int, float)):
-                return name, float(data['price']) / 100.0
-        return None
+        vol, _ = self._calc_vol_part(pid)
+
+        # Сначала хост, сработавший в прошлый раз, затем шард по таблице маршрутизации
+        hosts = []
+        cached = self._cached_source(product_id)
+        if cached and cached[0] == 'basket' and cached[1]:
+            hosts.append(cached[1])
+        number = self._basket_number(vol)
+        if number is not None:
+            host = self.basket_host_template.format(number)
+            if host not in hosts:
+                hosts.append(host)
+        for host in hosts:
+            result = await self._fetch_basket_host(product_id, host)
+            if result:
+                return result
+
+        # Таблица устарела или vol новее ее последней записи — пробуем соседние шарды параллельно
+        if number is None:
+            number = self.basket_routes[-1][1] if self.basket_routes else 1
+        candidates = [host for host in self._basket_candidates(number) if host not in hosts]
+        if not candidates:
+            return None
+        return await self._probe_basket_hosts(product_id, candidates)
+
+    def _cached_source(self, product_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Источник (v2/v1/basket и хост), через который артикул получился в прошлый раз"""
+        entry = self.sources.get(product_id)
+        if not entry:
+            return None
+        source, host, resolved_at = entry
+        if time.time() - resolved_at > WB_SOURCE_CACHE_TTL:
+            del self.sources[product_id]
+            return None
+        return source, host
+
+    def _remember_source(self, product_id: str, source: str, host: Optional[str] = None):
+        PRICE_SOURCE_TOTAL.inc(source)
+        now = time.time()
+        entry = self.sources.get(product_id)
+        # Не переписываем свежую запись без изменений, чтобы не писать в базу на каждой проверке
+        if entry and entry[0] == source and entry[1] == host and now - entry[2] < WB_SOURCE_CACHE_TTL / 2:
+            return
+        self.sources[product_id] = (source, host, now)
+        self._dirty_sources.add(product_id)
+
+    def preferred_source(self, product_id: str) -> Optional[str]:
+        cached = self._cached_source(product_id)
+        return cached[0] if cached else None
+
+    def load_sources(self, entries: Dict[str, Tuple[str, Optional[str], float]]):
+        """Загружает сохраненный кэш источников (артикул -> источник, хост, время)"""
+        self.sources.update(entries)
+
+    def pop_dirty_sources(self) -> Dict[str, Tuple[str, Optional[str], float]]:
+        """Возвращает и сбрасывает записи кэша источников, изменившиеся с прошлого сохранения"""
+        dirty = {pid: self.sources[pid] for pid in self._dirty_sources if pid in self.sources}
+        self._dirty_sources.clear()
+        return dirty
+
+    async def get_prices_batch(self, product_ids: List[str],
+                               batch_size: int = WB_BATCH_SIZE) -> Dict[str, Tuple[str, float]]:
+        """Получает название и цену для списка артикулов пачками через cards/v2/detail.
+
+        Артикулы, которых нет в ответе, в результат не попадают — для них
+        вызывающий код использует get_product_info_by_id(..., skip=('v2',)), чтобы не спрашивать v2 повторно.
+        """
+        if not self.health['v2'].is_available():
+            return {}
+        batch_size = max(batch_size, 1)
+        unique_ids = list(dict.fromkeys(product_ids))
+        chunks = [unique_ids[i:i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+        results: Dict[str, Tuple[str, float]] = {}
+        for chunk_result in await asyncio.gather(*(self._try_cards_v2_batch(chunk) for chunk in chunks)):
+            results.update(chunk_result)
+        return results
 
     async def get_product_info(self, url: str) -> Optional[Tuple[str, float]]:
         """Получает информацию о товаре: название и цену"""
+        product_id = self.extract_product_id(url)
+        if not product_id:
+            return None
+        return await self.get_product_info_by_id(product_id)
+
+    def _fetcher(self, source: str):
+        return {'v2': self._try_cards_v2, 'v1': self._try_cards_v1, 'basket': self._try_basket_json}[source]
+
+    def _hedge_delay(self, source: str) -> float:
+        return max(WB_HEDGE_MIN_DELAY, self.health[source].percentile(0.95, WB_HEDGE_DEFAULT_DELAY))
+
+    async def _fetch_hedged(self, product_id: str, order: List[str]) -> Optional[Tuple[str, float]]:
+        """Опрашивает источники по порядку, но не ждет медленный дольше его p95:
+        по истечении задержки параллельно запускается следующий, побеждает первый успешный ответ"""
+        queue = list(order)
+        pending = set()
         try:
-            product_id = self.extract_product_id(url)
-            if not product_id:
-                return None
+            while queue or pending:
+                # Следующий источник стартует по таймауту хеджирования или после неудачи предыдущего
+                if queue:
+                    source = queue.pop(0)
+                    pending.add(asyncio.create_task(self._fetcher(source)(product_id)))
+                    delay = self._hedge_delay(source)
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay if queue else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_product_info_by_id(self, product_id: str,
+                                     skip: Tuple[str, ...] = ()) -> Optional[Tuple[str, float]]:
+        """Получает название и цену товара по артикулу.
 
-            # Пытаемся в порядке: v2 -> v1 -> basket
-            for fetcher in (self._try_cards_v2, self._try_cards_v1, self._try_basket_json):
-                result = await fetcher(product_id)
+        skip — источники, которые уже опрошены для этого артикула (например, v2 после пакетного запроса).
+        Если этот артикул уже запрашивается (в любой записи: 0555 и 555 — один товар),
+        вызов дожидается идущего запроса вместо нового.
+        """
+        product_id = self.normalize_product_id(str(product_id))
+        if product_id is None:
+            return None
+        return await self._inflight.do(product_id, lambda: self._fetch_product_info(product_id, skip))
+
+    async def _fetch_product_info(self, product_id: str, skip: Tuple[str, ...] = ()) -> Optional[Tuple[str, float]]:
+        try:
+            # Пытаемся в порядке: v2 -> v1 -> basket, начиная с источника, сработавшего в прошлый раз;
+            # источники с открытым breaker и из skip пропускаем
+            order = [source for source in SOURCES if source not in skip and self.health[source].is_available()]
+            preferred = self.preferred_source(product_id)
+            if preferred in order:
+                order.remove(preferred)
+                order.insert(0, preferred)
+            if self.hedge_requests:
+                return await self._fetch_hedged(product_id, order)
+            for source in order:
+                result = await self._fetcher(source)(product_id)
                 if result:
                     return result
 
@@ -171,14 +481,73 @@ class WildberriesPriceParser:
             return None
 
 
-# Функция для удобного использования
+# Общий парсер процесса: создается при старте приложения и переиспользуется всеми
+_shared_parser: Optional[WildberriesPriceParser] = None
+
+
+async def start_shared_parser() -> WildberriesPriceParser:
+    """Создает общий парсер с пулом соединений (вызывается при старте приложения)"""
+    global _shared_parser
+    if _shared_parser is None:
+        _shared_parser = WildberriesPriceParser(TokenBucket(WB_RATE_LIMIT, WB_RATE_BURST))
+        _shared_parser.bind_metrics()
+    await _shared_parser.start()
+    return _shared_parser
+
+
+async def close_shared_parser():
+    """Закрывает общий парсер (вызывается при остановке приложения)"""
+    global _shared_parser
+    if _shared_parser is not None:
+        await _shared_parser.close()
+        _shared_parser = None
+
+
+def get_shared_parser() -> Optional[WildberriesPriceParser]:
+    return _shared_parser
+
+
+def normalize_article_id(product_id: str) -> Optional[str]:
+    """Приводит артикул к каноническому виду (без ведущих нулей), None — если это не артикул"""
+    product_id = product_id.strip()
+    if not product_id.isdigit():
+        return None
+    return str(int(product_id))
+
+
+# Функция для удобного использования: только разбор ссылки, без парсера и сети
+def extract_wildberries_article(url: str) -> Optional[str]:
+    """Удобная функция для получения артикула WB из ссылки"""
+    try:
+        # Если просто число
+        if url.isdigit():
+            return normalize_article_id(url)
+
+        for pattern in PRODUCT_URL_PATTERNS:
+            match = pattern.search(url)
+            if match:
+                return normalize_article_id(match.group(1))
+
+        query_params = parse_qs(urlparse(url).query)
+        if query_params.get('nm'):
+            return normalize_article_id(query_params['nm'][0])
+
+        return None
+    except Exception:
+        return None
+
+
 async def get_wildberries_price(url: str) -> Optional[Tuple[str, float]]:
     """Удобная функция для получения цены и названия товара с Wildberries"""
+    if _shared_parser is not None:
+        return await _shared_parser.get_product_info(url)
     async with WildberriesPriceParser() as parser:
         return await parser.get_product_info(url)
 
 
 async def check_wildberries_price(url: str) -> Optional[float]:
     """Удобная функция для проверки цены товара с Wildberries"""
+    if _shared_parser is not None:
+        return await _shared_parser.check_price(url)
     async with WildberriesPriceParser() as parser:
         return await parser.check_price(url)
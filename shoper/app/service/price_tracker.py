@@ -1,42 +1,337 @@
+import os
+import time
+import heapq
 import asyncio
-from typing import List
+import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 from aiogram import Bot
-from app.database.request import get_products_for_price_check, update_product_price, get_user
-from app.service.price_parser import check_wildberries_price
+from app.database.request import (
+    iter_products_for_price_check, get_product, update_product_prices, get_user_by_id,
+    get_products_without_article_id, set_product_article_ids,
+    get_article_sources, save_article_sources, add_price_history,
+    get_article_schedules, save_article_schedules, get_max_product_id,
+)
+from app.database.price_cache import set_latest_prices
+from app.service.price_parser import WildberriesPriceParser, get_shared_parser, WB_BATCH_SIZE, WB_SOURCE_CACHE_TTL
+from app.service.notifier import NotificationDispatcher
+from app.service.metrics import Counter, Gauge, Histogram
+
+
+# Число параллельных проверок цен
+TRACKER_CONCURRENCY = int(os.getenv('WB_TRACKER_CONCURRENCY', 8))
+# Адаптивное расписание: интервал проверки артикула в секундах
+CHECK_INTERVAL = float(os.getenv('WB_CHECK_INTERVAL', 1800))  # 30 минут для новых артикулов
+MIN_CHECK_INTERVAL = float(os.getenv('WB_MIN_CHECK_INTERVAL', 300))
+MAX_CHECK_INTERVAL = float(os.getenv('WB_MAX_CHECK_INTERVAL', 6 * 3600))
+# Как часто перечитывать список отслеживаемых артикулов из базы
+SCHEDULE_REFRESH_INTERVAL = float(os.getenv('WB_SCHEDULE_REFRESH_INTERVAL', 60))
+
+SWEEP_SECONDS = Histogram('wb_sweep_seconds', 'Длительность прохода проверки цен', buckets=(
+    0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+SWEEP_ARTICLES = Counter('wb_sweep_articles_total', 'Проверенные артикулы')
+PRICE_CHANGES = Counter('wb_price_changes_total', 'Обнаруженные изменения цен товаров')
+SCHEDULED_ARTICLES = Gauge('wb_tracker_scheduled_articles', 'Артикулы в расписании трекера')
+
+
+class SweepResult:
+    """Итоги одного прохода проверки цен. Цены и изменения сохраняются после каждой пачки,
+    поэтому здесь только счетчики"""
+
+    def __init__(self):
+        self.articles = 0
+        self.changes = 0
 
 
 class PriceTracker:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, parser: Optional[WildberriesPriceParser] = None,
+                 concurrency: int = TRACKER_CONCURRENCY, batch_size: int = WB_BATCH_SIZE,
+                 min_interval: float = MIN_CHECK_INTERVAL, max_interval: float = MAX_CHECK_INTERVAL,
+                 notifier: Optional[NotificationDispatcher] = None,
+                 owns: Optional[Callable[[str], bool]] = None):
         self.bot = bot
+        # Очередь уведомлений: проверка цен не ждет доставки сообщений
+        self.notifier = notifier
         self.is_running = False
+        # Остановка: начатые пачки доводим до сохранения, новые не берем
+        self._stopping = False
+        # Общий парсер приложения; лимит запросов к WB задан в нем
+        self.parser = parser or get_shared_parser()
+        self.concurrency = max(1, concurrency)
+        # Сколько разных артикулов проверять одним запросом
+        self.batch_size = max(1, batch_size)
+        self._sources_loaded = False
+        # Расписание: артикул -> (интервал, время следующей проверки) и куча (время, артикул)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._schedule: Dict[str, Tuple[float, float]] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._refreshed_at = 0.0
+        # Товары с id не больше этого уже учтены в расписании; _full_refresh — перечитать все
+        self._last_product_id = 0
+        self._full_refresh = True
+        # Фильтр артикулов воркера (партиции), None — трекер проверяет все артикулы
+        self.owns = owns
+        self._wakeup = asyncio.Event()
+        SCHEDULED_ARTICLES.set_function(lambda: len(self._schedule))
 
     async def start_tracking(self):
-        """Запускает отслеживание цен"""
+        """Запускает отслеживание цен: каждый артикул проверяется по своему расписанию"""
         self.is_running = True
+        self._stopping = False
         while self.is_running:
             try:
-                await self.check_all_prices()
-                # Проверяем цены каждые 30 минут
-                await asyncio.sleep(1800)  # 30 минут
+                if time.time() - self._refreshed_at >= SCHEDULE_REFRESH_INTERVAL:
+                    await self._refresh_schedule()
+
+                due = self._pop_due(time.time())
+                if due:
+                    await self.check_articles(due)
+                    continue
+
+                # Спим до ближайшей проверки или до перечитывания списка артикулов
+                wake_at = self._refreshed_at + SCHEDULE_REFRESH_INTERVAL
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(wake_at - time.time(), 0.1))
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
             except Exception as e:
                 print(f"Ошибка в отслеживании цен: {e}")
                 await asyncio.sleep(300)  # 5 минут при ошибке
 
+    def request_refresh(self):
+        """Перечитать расписание целиком на следующей итерации (например, после смены партиций)"""
+        self._refreshed_at = 0.0
+        self._full_refresh = True
+        self._wakeup.set()
+
     async def stop_tracking(self):
-        """Останавливает отслеживание цен"""
+        """Останавливает отслеживание цен: start_tracking завершится, как только сохранит начатые пачки"""
         self.is_running = False
+        self._stopping = True
+        self._wakeup.set()
+
+    async def _refresh_schedule(self):
+        """Добавляет в расписание артикулы товаров, появившихся с прошлого раза.
+
+        Читаются только товары с id больше уже учтенного; целиком база читается при первом запуске
+        и после request_refresh(). Артикулы, у которых не осталось активных товаров, убирает
+        check_articles, когда до них доходит очередь.
+        """
+        full, self._full_refresh = self._full_refresh, False
+        after_id = 0 if full else self._last_product_id
+        until_id = await get_max_product_id()
+        await self._prepare_sweep(after_id, until_id)
+        now = time.time()
+        stored = await get_article_schedules(after_id, until_id)
+        if self.owns is not None:
+            stored = {article_id: entry for article_id, entry in stored.items() if self.owns(article_id)}
+        if full:
+            for article_id in list(self._schedule):
+                if article_id not in stored:
+                    del self._schedule[article_id]
+        for article_id, (interval, next_check_at) in stored.items():
+            if article_id in self._schedule:
+                continue
+            interval = interval or CHECK_INTERVAL
+            # Новые артикулы проверяем сразу
+            due = next_check_at.timestamp() if next_check_at else now
+            self._schedule[article_id] = (interval, due)
+            heapq.heappush(self._heap, (due, article_id))
+        self._last_product_id = until_id
+        self._refreshed_at = now
+
+    def _pop_due(self, now: float) -> List[str]:
+        """Достает из кучи все артикулы, время проверки которых наступило"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, article_id = heapq.heappop(self._heap)
+            entry = self._schedule.get(article_id)
+            # Устаревшие записи кучи (артикул удален или перепланирован) пропускаем
+            if entry is None or entry[1] != due_at:
+                continue
+            due.append(article_id)
+        return due
+
+    async def _reschedule(self, article_ids: List[str], changed: set, failed: set = frozenset()):
+        """Подстраивает интервалы под частоту изменений и сохраняет расписание в базу.
+
+        failed — артикулы, цену которых получить не удалось: их интервал не меняется,
+        иначе сбой WB отодвинул бы весь каталог к максимальному интервалу.
+        """
+        now = time.time()
+        schedules = {}
+        for article_id in article_ids:
+            interval = self._schedule.get(article_id, (CHECK_INTERVAL, now))[0]
+            if article_id in changed:
+                # Цена двигается — проверяем чаще
+                interval = max(self.min_interval, interval / 2)
+            elif article_id not in failed:
+                interval = min(self.max_interval, interval * 1.5)
+            due = now + interval
+            if article_id in self._schedule:
+                self._schedule[article_id] = (interval, due)
+                heapq.heappush(self._heap, (due, article_id))
+            schedules[article_id] = (interval, datetime.datetime.fromtimestamp(due))
+        await save_article_schedules(schedules)
 
     async def check_all_prices(self):
         """Проверяет цены всех товаров"""
-        products = await get_products_for_price_check()
-        
-        for product in products:
+        await self._prepare_sweep()
+        await self._run_sweep(iter_products_for_price_check())
+
+    async def check_articles(self, article_ids: List[str]):
+        """Проверяет цены товаров с указанными артикулами"""
+        seen = set()
+        completed = False
+        try:
+            await self._run_sweep(iter_products_for_price_check(article_ids), seen)
+            completed = True
+        finally:
+            # Каждая пачка перепланирует свои артикулы сама; те, что остались без нового времени
+            # (ошибка пачки или прохода), тоже должны вернуться в расписание.
+            # При остановке их не трогаем: в базе остается прежнее время, и после запуска они проверятся сразу
+            if not self._stopping:
+                if completed:
+                    # Активных товаров артикула не осталось — больше его не проверяем
+                    for article_id in article_ids:
+                        if article_id not in seen:
+                            self._schedule.pop(article_id, None)
+                now = time.time()
+                leftovers = [
+                    article_id for article_id in article_ids
+                    if article_id in self._schedule and self._schedule[article_id][1] <= now
+                ]
+                await self._reschedule(leftovers, set(), failed=set(leftovers))
+
+    async def _run_sweep(self, rows: AsyncIterator, seen: Optional[set] = None) -> "SweepResult":
+        """Проверяет цены потока товаров, упорядоченного по артикулу.
+
+        Пачки артикулов отправляются воркерам по мере чтения из базы; очередь ограничена,
+        поэтому в памяти одновременно лишь несколько пачек. Результат каждой пачки воркер
+        сохраняет сразу (см. check_batch), так что прерванный проход не теряет уже найденное.
+        В seen, если передан, попадают артикулы, у которых нашлись активные товары.
+        """
+        result = SweepResult()
+        started = time.perf_counter()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        # Воркеры разбирают очередь параллельно, частоту запросов ограничивает rate_limiter парсера
+        workers = [
+            asyncio.create_task(self._sweep_worker(queue, result))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            async for batch in self._iter_batches(rows):
+                if self._stopping:
+                    break
+                if seen is not None:
+                    seen.update(product_id for product_id, _ in batch)
+                await queue.put(batch)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Источники, изменившиеся после последней сохраненной пачки
+            await save_article_sources(self.parser.pop_dirty_sources())
+        if self.notifier:
+            self.notifier.flush_digests()
+        SWEEP_SECONDS.observe(time.perf_counter() - started)
+        return result
+
+    async def _prepare_sweep(self, after_id: int = 0, until_id: Optional[int] = None):
+        """Загружает кэш источников и заполняет артикулы у товаров, добавленных до их хранения.
+
+        after_id / until_id — диапазон id товаров: при обновлении расписания каждый товар разбирается
+        один раз, и ссылки, из которых артикул не извлекается, не перечитываются снова.
+        """
+        if not self._sources_loaded:
+            self.parser.load_sources(await get_article_sources(WB_SOURCE_CACHE_TTL))
+            self._sources_loaded = True
+
+        article_ids = {}
+        for product_id, url in await get_products_without_article_id(after_id, until_id):
+            article_id = self.parser.extract_product_id(url)
+            if article_id:
+                article_ids[product_id] = article_id
+        await set_product_article_ids(article_ids)
+
+    async def _iter_batches(self, rows: AsyncIterator):
+        """Собирает идущие подряд товары одного артикула в группы, а группы — в пачки по batch_size"""
+        batch: List[Tuple[str, List[object]]] = []
+        group: List[object] = []
+        group_id = None
+        async for row in rows:
+            if row.article_id != group_id:
+                if group:
+                    batch.append((group_id, group))
+                    if len(batch) >= self.batch_size:
+                        yield batch
+                        batch = []
+                group_id, group = row.article_id, []
+            group.append(row)
+        if group:
+            batch.append((group_id, group))
+        if batch:
+            yield batch
+
+    async def _sweep_worker(self, queue: asyncio.Queue, result: "SweepResult"):
+        """Обрабатывает пачки артикулов из очереди проверки"""
+        while True:
+            batch = await queue.get()
             try:
-                await self.check_single_product(product)
-                # Небольшая задержка между запросами
-                await asyncio.sleep(2)
+                await self.check_batch(batch, result)
             except Exception as e:
-                print(f"Ошибка при проверке товара {product.id}: {e}")
+                print(f"Ошибка при проверке пачки товаров: {e}")
+            finally:
+                queue.task_done()
+
+    async def check_batch(self, batch: List[Tuple[str, List[object]]], result: "SweepResult"):
+        """Проверяет цены пачки артикулов одним запросом, раздает результат всем подписчикам
+        и сразу сохраняет изменения, историю, последние цены и расписание пачки"""
+        # Артикулы, которые в прошлый раз нашлись только через v1/basket, сразу идут в свой источник
+        batch_ids = [
+            product_id for product_id, _ in batch
+            if self.parser.preferred_source(product_id) in (None, 'v2')
+        ]
+        results = await self.parser.get_prices_batch(batch_ids, self.batch_size) if batch_ids else {}
+        # Артикулов нет в пакетном ответе — идем по цепочке источников один раз на артикул, параллельно.
+        # Тех, что уже были в пачке, в v2 повторно не запрашиваем
+        in_batch = set(batch_ids)
+        misses = [product_id for product_id, _ in batch if product_id not in results]
+        fallback = await asyncio.gather(*(
+            self.parser.get_product_info_by_id(product_id, skip=('v2',) if product_id in in_batch else ())
+            for product_id in misses
+        ), return_exceptions=True)
+        for product_id, info in zip(misses, fallback):
+            if isinstance(info, Exception):
+                print(f"Ошибка при проверке артикула {product_id}: {info}")
+            elif info is not None:
+                results[product_id] = info
+        prices, names, changes, changed = {}, {}, {}, set()
+        for product_id, products in batch:
+            info = results.get(product_id)
+            if info is None:
+                continue
+            prices[product_id] = info[1]
+            names[product_id] = info[0]
+            for product in products:
+                if self._collect_change(product, info[1], changes):
+                    changed.add(product_id)
+
+        await self._save_price_changes(changes)
+        await add_price_history(prices)
+        await set_latest_prices(prices, names)
+        await save_article_sources(self.parser.pop_dirty_sources())
+        failed = {product_id for product_id, _ in batch if product_id not in prices}
+        await self._reschedule([product_id for product_id, _ in batch], changed, failed)
+        result.articles += len(batch)
+        result.changes += len(changes)
+        SWEEP_ARTICLES.inc(amount=len(batch))
+        PRICE_CHANGES.inc(amount=len(changes))
 
     async def check_single_product(self, product):
         """Проверяет цену одного товара"""
@@ -45,37 +340,61 @@ class PriceTracker:
             if 'wildberries.ru' not in product.url and 'wb.ru' not in product.url:
                 return
 
-            new_price = await check_wildberries_price(product.url)
+            product_id = product.article_id or self.parser.extract_product_id(product.url)
+            if not product_id:
+                return
+
+            result = await self.parser.get_product_info_by_id(product_id)
             
-            if new_price is None:
+            if result is None:
                 return
 
-            # Если цена изменилась
-            if abs(new_price - product.current_price) > 0.01:  # Учитываем небольшие различия
-                old_price = product.current_price
-                
-                # Обновляем цену в базе
-                updated_product = await update_product_price(product.id, new_price)
-                
-                if updated_product:
-                    # Проверяем, нужно ли отправить уведомление
-                    price_difference = abs(new_price - old_price)
-                    
-                    if price_difference >= product.price_threshold:
-                        await self.send_price_notification(updated_product, old_price, new_price)
+            changes = {}
+            self._collect_change(product, result[1], changes)
+            await self._save_price_changes(changes)
+            await add_price_history({product_id: result[1]})
+            await set_latest_prices({product_id: result[1]}, {product_id: result[0]})
 
         except Exception as e:
             print(f"Ошибка при проверке товара {product.id}: {e}")
 
+    def _collect_change(self, product, new_price: float, changes: Dict[int, float]) -> bool:
+        """Запоминает новую цену товара, если она изменилась"""
+        if abs(new_price - product.current_price) > 0.01:  # Учитываем небольшие различия
+            changes[product.id] = new_price
+            return True
+        return False
+
+    async def _save_price_changes(self, changes: Dict[int, float]):
+        """Сохраняет изменения цен одной транзакцией и отправляет уведомления"""
+        if not changes:
+            return
+        updated_products = await update_product_prices(changes)
+        for product in updated_products:
+            old_price, new_price = product.previous_price, product.current_price
+            # Проверяем, нужно ли отправить уведомление
+            if old_price is not None and abs(new_price - old_price) >= product.price_threshold:
+                await self.send_price_notification(product, old_price, new_price)
+
     async def send_price_notification(self, product, old_price, new_price):
         """Отправляет уведомление об изменении цены"""
         try:
-            user = await get_user(product.user_id)
+            user = await get_user_by_id(product.user_id)
             if not user:
                 return
 
             price_difference = new_price - old_price
             change_type = "выросла" if price_difference > 0 else "упала"
+
+            if self.notifier and user.digest_mode:
+                # Режим сводки: все изменения за проход придут одним сообщением
+                self.notifier.add_to_digest(
+                    user.tg_id,
+                    f"📦 {product.name}\n"
+                    f"💰 {old_price:.2f} → {new_price:.2f} ₽ ({price_difference:+.2f} ₽)\n"
+                    f"🔗 {product.url}"
+                )
+                return
             
             message = f"🔔 Изменение цены!\n\n"
             message += f"📦 Товар: {product.name}\n"
@@ -84,7 +403,10 @@ class PriceTracker:
             message += f"📈 Изменение: {price_difference:+.2f} ₽ ({change_type})\n\n"
             message += f"🔗 Ссылка: {product.url}"
 
-            await self.bot.send_message(user.tg_id, message)
+            if self.notifier:
+                self.notifier.send(user.tg_id, message)
+            else:
+                await self.bot.send_message(user.tg_id, message)
             
         except Exception as e:
             print(f"Ошибка при отправке уведомления: {e}")
@@ -92,10 +414,9 @@ class PriceTracker:
     async def check_price_now(self, product_id: int) -> bool:
         """Проверяет цену конкретного товара прямо сейчас"""
         try:
-            product = await get_products_for_price_check()
-            product = next((p for p in product if p.id == product_id), None)
+            product = await get_product(product_id)
             
-            if not product:
+            if not product or not product.is_active:
                 return False
                 
             await self.check_single_product(product)
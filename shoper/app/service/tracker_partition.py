@@ -0,0 +1,69 @@
+import os
+import zlib
+import uuid
+import socket
+import time
+import asyncio
+from typing import Optional, Set
+
+from app.database.request import heartbeat_tracker_worker, release_tracker_worker
+
+
+# Артикулы делятся на фиксированное число партиций, партиции — между воркерами трекера
+TRACKER_PARTITIONS = int(os.getenv('WB_TRACKER_PARTITIONS', 64))
+TRACKER_HEARTBEAT = float(os.getenv('WB_TRACKER_HEARTBEAT', 15))  # сек между heartbeat
+TRACKER_LEASE_TTL = float(os.getenv('WB_TRACKER_LEASE_TTL', 60))  # через сколько аренда упавшего воркера освобождается
+
+
+def article_partition(article_id: str, partitions: int = TRACKER_PARTITIONS) -> int:
+    """Партиция артикула: стабильный хэш, одинаковый во всех процессах"""
+    return zlib.crc32(article_id.encode()) % partitions
+
+
+class PartitionLease:
+    """Партиции артикулов, которыми владеет воркер трекера.
+
+    Владение подтверждается арендами в базе: heartbeat продлевает их и перераспределяет
+    партиции, когда воркеры появляются или пропадают.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, partitions: int = TRACKER_PARTITIONS,
+                 heartbeat: float = TRACKER_HEARTBEAT, lease_ttl: float = TRACKER_LEASE_TTL):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.partitions = partitions
+        self.heartbeat_interval = heartbeat
+        self.lease_ttl = max(lease_ttl, heartbeat * 2)
+        self.owned: Set[int] = set()
+        self._renewed_at = 0.0
+        self.on_change = None  # вызывается при изменении набора партиций
+
+    def owns(self, article_id: str) -> bool:
+        return article_partition(article_id, self.partitions) in self.owned
+
+    async def heartbeat(self):
+        owned = set(await heartbeat_tracker_worker(self.worker_id, self.partitions, self.lease_ttl))
+        self._renewed_at = time.monotonic()
+        self._set_owned(owned)
+
+    def _set_owned(self, owned: Set[int]):
+        if owned != self.owned:
+            print(f"Воркер {self.worker_id}: партиций {len(owned)} из {self.partitions}")
+            self.owned = owned
+            if self.on_change:
+                self.on_change()
+
+    async def run(self):
+        """Периодический heartbeat; если аренды не удается продлить дольше их срока, партиции отпускаются"""
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                print(f"Ошибка heartbeat воркера {self.worker_id}: {e}")
+                if time.monotonic() - self._renewed_at > self.lease_ttl:
+                    # Аренды уже могли перейти к другим воркерам
+                    self._set_owned(set())
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def release(self):
+        self.owned = set()
+        await release_tracker_worker(self.worker_id)
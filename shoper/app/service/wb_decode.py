@@ -0,0 +1,132 @@
+import json
+from typing import List, NamedTuple, Optional, Union
+
+# Быстрый разбор ответов card.wb.ru: msgspec (типизированные структуры) или orjson, если установлены.
+# Без них используется стандартный json.
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+UNKNOWN_NAME = 'Неизвестный товар'
+
+
+class PriceRecord(NamedTuple):
+    """Компактная запись о цене товара из ответа cards/detail"""
+    article_id: str
+    name: str
+    price: float
+
+
+def _pick_price_cents(sale_price, price, size_price, sizes_only: bool) -> Optional[float]:
+    if not sizes_only:
+        if isinstance(sale_price, (int, float)):
+            return sale_price
+        if isinstance(price, (int, float)):
+            return price
+    return size_price
+
+
+def _records_from_dict(data, sizes_only: bool = False) -> List[PriceRecord]:
+    """Разбор уже декодированного JSON (dict)"""
+    records = []
+    if not isinstance(data, dict):
+        return records
+    for product in (data.get('data') or {}).get('products') or []:
+        size_price = None
+        for size in product.get('sizes') or []:
+            price_obj = size.get('price') or {}
+            if 'product' in price_obj:
+                size_price = price_obj['product']
+                break
+        price_cents = _pick_price_cents(product.get('salePriceU'), product.get('priceU'), size_price, sizes_only)
+        if price_cents is None:
+            continue
+        product_id = product.get('id')
+        records.append(PriceRecord(
+            str(product_id) if product_id is not None else '',
+            product.get('name') or UNKNOWN_NAME,
+            float(price_cents) / 100.0,
+        ))
+    return records
+
+
+if msgspec is not None:
+    class _SizePrice(msgspec.Struct):
+        product: Optional[float] = None
+
+    class _Size(msgspec.Struct):
+        price: Optional[_SizePrice] = None
+
+    class _Product(msgspec.Struct):
+        id: Optional[int] = None
+        name: Optional[str] = None
+        salePriceU: Optional[float] = None
+        priceU: Optional[float] = None
+        sizes: List[_Size] = []
+
+    class _Data(msgspec.Struct):
+        products: List[_Product] = []
+
+    class _Response(msgspec.Struct):
+        data: Optional[_Data] = None
+
+    # Декодер читает только описанные поля, остальное содержимое ответа пропускается без создания объектов
+    _decoder = msgspec.json.Decoder(_Response)
+
+    def _records_msgspec(body: Union[bytes, str], sizes_only: bool) -> List[PriceRecord]:
+        response = _decoder.decode(body)
+        records = []
+        if response.data is None:
+            return records
+        for product in response.data.products:
+            size_price = None
+            for size in product.sizes:
+                if size.price is not None and size.price.product is not None:
+                    size_price = size.price.product
+                    break
+            price_cents = _pick_price_cents(product.salePriceU, product.priceU, size_price, sizes_only)
+            if price_cents is None:
+                continue
+            records.append(PriceRecord(
+                str(product.id) if product.id is not None else '',
+                product.name or UNKNOWN_NAME,
+                float(price_cents) / 100.0,
+            ))
+        return records
+
+
+def loads(body: Union[bytes, str]):
+    """json.loads через orjson, если он установлен"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def decode_card_products(body: Union[bytes, str], sizes_only: bool = False,
+                         backend: Optional[str] = None) -> List[PriceRecord]:
+    """Достает из ответа cards/detail записи (артикул, название, цена в рублях).
+
+    Цена берется из salePriceU, затем priceU, затем из первого размера (sizes[].price.product);
+    sizes_only=True — только из размеров, как в ответе cards/v1. backend позволяет
+    выбрать 'msgspec', 'orjson' или 'json' явно (для бенчмарка).
+    """
+    backend = backend or BACKEND
+    if backend == 'msgspec':
+        try:
+            return _records_msgspec(body, sizes_only)
+        except msgspec.ValidationError:
+            # Неожиданные типы полей — разбираем универсальным путем
+            return _records_from_dict(loads(body), sizes_only)
+    if backend == 'orjson':
+        return _records_from_dict(orjson.loads(body), sizes_only)
+    return _records_from_dict(json.loads(body), sizes_only)
+
+
+BACKEND = 'msgspec' if msgspec is not None else 'orjson' if orjson is not None else 'json'
@@ -0,0 +1,128 @@
+import os
+import time
+import signal
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+# Настройки режима webhook
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # внешний адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+# Сколько обновлений обрабатывается одновременно; остальные ждут своей очереди
+WEBHOOK_CONCURRENCY = int(os.getenv('WB_WEBHOOK_CONCURRENCY', 64))
+# Сколько ждать завершения начатых обработчиков при остановке
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WB_WEBHOOK_DRAIN_TIMEOUT', 25))
+# Сколько после сигнала остановки отвечать 503 на /healthz, прежде чем закрыть порт (для балансировщика)
+WEBHOOK_STOP_GRACE = float(os.getenv('WB_WEBHOOK_STOP_GRACE', 0))
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Ограничивает число одновременно обрабатываемых обновлений и считает начатые обработчики"""
+
+    def __init__(self, limit: int = WEBHOOK_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(max(1, limit))
+        self.in_flight = 0  # обновления в обработке и в ожидании семафора
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            async with self.semaphore:
+                return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Ждет завершения начатых обработчиков; False, если не успели за timeout"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, health: Optional[Callable[[], dict]] = None,
+                      on_drained: Optional[Callable[[], Awaitable[None]]] = None):
+    """Принимает обновления через webhook до сигнала остановки, затем дожидается начатых обработчиков.
+
+    /healthz отвечает 200, пока инстанс принимает обновления, и 503 во время остановки,
+    чтобы балансировщик перестал направлять на него запросы. health() добавляет в ответ свои поля.
+    on_drained() вызывается после обработчиков, но до закрытия сессии бота (например, чтобы
+    остановить трекер и отправить оставшиеся уведомления).
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook задайте WEBHOOK_URL")
+
+    limiter = ConcurrencyLimitMiddleware()
+    dp.update.outer_middleware(limiter)
+    started_at = time.monotonic()
+    stopping = asyncio.Event()
+
+    async def healthz(request: web.Request) -> web.Response:
+        body = {
+            'status': 'draining' if stopping.is_set() else 'ok',
+            'uptime': round(time.monotonic() - started_at),
+            'in_flight': limiter.in_flight,
+        }
+        if health:
+            body.update(health())
+        return web.json_response(body, status=503 if stopping.is_set() else 200)
+
+    app = web.Application()
+    app.router.add_get('/healthz', healthz)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка по KeyboardInterrupt
+
+    try:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        print(f"Webhook запущен на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+        await stopping.wait()
+    finally:
+        stopping.set()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except (NotImplementedError, RuntimeError):
+                pass
+        # Новые запросы больше не принимаем, начатые обработчики доводим до конца.
+        # Webhook в Telegram не удаляем: остальные инстансы за балансировщиком продолжают работать,
+        # а неподтвержденные обновления Telegram отправит повторно
+        if WEBHOOK_STOP_GRACE > 0:
+            await asyncio.sleep(WEBHOOK_STOP_GRACE)
+        await site.stop()
+        if not await limiter.drain(WEBHOOK_DRAIN_TIMEOUT):
+            print(f"Не дождались обработчиков: {limiter.in_flight}")
+        try:
+            if on_drained:
+                await on_drained()
+        finally:
+            # Закрывает и сессию бота (SimpleRequestHandler.close)
+            await runner.cleanup()
@@ -0,0 +1,49 @@
+"""Микробенчмарк разбора ответа cards/v2/detail: json / orjson / msgspec.
+
+Запуск из каталога shoper:
+    python benchmarks/bench_decode.py [--fixture путь] [--number N]
+"""
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.service import wb_decode  # noqa: E402
+
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'cards_v2_detail.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.fixture, 'rb') as f:
+        body = f.read()
+
+    backends = ['json']
+    if wb_decode.orjson is not None:
+        backends.append('orjson')
+    if wb_decode.msgspec is not None:
+        backends.append('msgspec')
+
+    reference = wb_decode.decode_card_products(body, backend='json')
+    print(f"Фикстура: {args.fixture} ({len(body) / 1024:.0f} КБ, товаров: {len(reference)})")
+
+    baseline = None
+    for backend in backends:
+        records = wb_decode.decode_card_products(body, backend=backend)
+        assert records == reference, f"{backend}: результат отличается от json"
+        seconds = min(timeit.repeat(
+            lambda: wb_decode.decode_card_products(body, backend=backend), number=args.number, repeat=5
+        )) / args.number
+        baseline = baseline or seconds
+        print(f"{backend:8} {seconds * 1e6:9.1f} мкс/ответ  x{baseline / seconds:.1f}")
+
+
+if __name__ == '__main__':
+    main()
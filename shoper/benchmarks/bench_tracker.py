@@ -0,0 +1,242 @@
+"""Бенчмарк трекера цен на локальной заглушке Wildberries (benchmarks/wb_stub.py).
+
+Заполняет временную базу SQLite пользователями и товарами, запускает несколько проходов
+PriceTracker.check_all_prices() и печатает для каждого: время прохода, HTTP-запросов в секунду,
+p50/p95/p99 задержки запросов, статусы ответов; в конце — пиковое потребление памяти (RSS).
+
+Запуск из каталога shoper:
+    python benchmarks/bench_tracker.py --users 1000 --products 20000 --articles 5000 --latency 30
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--articles', type=int, default=2000, help='число разных артикулов среди товаров')
+    parser.add_argument('--sweeps', type=int, default=3, help='проходов трекера (первый — «холодный»)')
+    parser.add_argument('--concurrency', type=int, default=None, help='WB_TRACKER_CONCURRENCY')
+    parser.add_argument('--batch-size', type=int, default=None, help='WB_BATCH_SIZE')
+    parser.add_argument('--rate-limit', type=float, default=0, help='запросов в секунду к WB, 0 — без лимита')
+    parser.add_argument('--latency', type=float, default=20.0, help='медианная задержка заглушки, мс')
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--v2-miss', type=float, default=0.05)
+    parser.add_argument('--change-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить результаты в файл JSON')
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает КБ, macOS — байты
+    return usage / 1024 / 1024 if sys.platform == 'darwin' else usage / 1024
+
+
+class CountingBot:
+    """Вместо Telegram: только считает уведомления"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text):
+        self.sent += 1
+
+
+async def seed_database(args, max_vol: int):
+    from sqlalchemy import insert
+    from app.database.models import init_models, async_session, User, Product
+
+    await init_models()
+    rnd = random.Random(args.seed)
+    # Артикулы в пределах таблицы basket и немного за ней (проверка пробы соседних шардов)
+    articles = rnd.sample(range(1_000_000, (max_vol + 50) * 100000), args.articles)
+    users = [{'tg_id': 10 ** 9 + i, 'name': f"user{i}"} for i in range(args.users)]
+    products = []
+    for i in range(args.products):
+        article_id = str(rnd.choice(articles))
+        products.append({
+            'user_id': rnd.randint(1, args.users),
+            'name': f"Товар {article_id}",
+            'url': f"https://www.wildberries.ru/catalog/{article_id}/detail.aspx",
+            'article_id': article_id,
+            'current_price': 0.0,
+            'price_threshold': 50.0,
+            'is_active': True,
+        })
+    async with async_session() as session:
+        await session.execute(insert(User), users)
+        await session.execute(insert(Product), products)
+        await session.commit()
+    return [str(article_id) for article_id in articles]
+
+
+async def run(args, port: int):
+    import aiohttp
+    from app.service.price_parser import WildberriesPriceParser, WB_BATCH_SIZE
+    from app.service.price_tracker import PriceTracker, TRACKER_CONCURRENCY
+    from app.service.rate_limiter import TokenBucket
+
+    base = f"http://127.0.0.1:{port}"
+    rate_limiter = TokenBucket(args.rate_limit, max(1, int(args.rate_limit))) if args.rate_limit else None
+    parser = WildberriesPriceParser(rate_limiter=rate_limiter)
+    parser.card_base = base
+    parser.basket_base = base + '/{host}'
+    parser.proxy_url = None
+    max_vol = parser.basket_routes[-1][0] if parser.basket_routes else 5000
+    articles = await seed_database(args, max_vol)
+
+    # Задержку каждого HTTP-запроса меряем через trace aiohttp (ответы из HTTP-кэша сюда не попадают)
+    latencies, statuses = [], Counter()
+
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        latencies.append(time.perf_counter() - context.started)
+        statuses[params.response.status] += 1
+
+    async def on_request_exception(session, context, params):
+        latencies.append(time.perf_counter() - context.started)
+        statuses[type(params.exception).__name__] += 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    connector = aiohttp.TCPConnector(limit=parser.limit, limit_per_host=parser.limit_per_host)
+    parser.session = aiohttp.ClientSession(headers=parser.headers, connector=connector, trace_configs=[trace])
+
+    bot = CountingBot()
+    tracker = PriceTracker(bot, parser,
+                           concurrency=args.concurrency or TRACKER_CONCURRENCY,
+                           batch_size=args.batch_size or WB_BATCH_SIZE)
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as control:
+            for sweep in range(args.sweeps):
+                latencies.clear()
+                statuses.clear()
+                sent_before = bot.sent
+                started = time.perf_counter()
+                await tracker.check_all_prices()
+                wall = time.perf_counter() - started
+                requests = len(latencies)
+                row = {
+                    'sweep': sweep + 1,
+                    'wall_s': round(wall, 3),
+                    'requests': requests,
+                    'req_per_s': round(requests / wall, 1) if wall else None,
+                    'products_per_s': round(args.products / wall, 1) if wall else None,
+                    'p50_ms': _ms(percentile(latencies, 0.50)),
+                    'p95_ms': _ms(percentile(latencies, 0.95)),
+                    'p99_ms': _ms(percentile(latencies, 0.99)),
+                    'statuses': {str(status): count for status, count in statuses.items()},
+                    'notifications': bot.sent - sent_before,
+                }
+                results.append(row)
+                print(f"Проход {row['sweep']}: {row['wall_s']} с, запросов {requests} ({row['req_per_s']}/с), "
+                      f"p50/p95/p99 {row['p50_ms']}/{row['p95_ms']}/{row['p99_ms']} мс, "
+                      f"уведомлений {row['notifications']}, статусы {row['statuses']}")
+                # Меняем часть цен к следующему проходу
+                async with control.post(f"{base}/_bench/advance", json={'ids': articles}) as response:
+                    await response.read()
+            async with control.get(f"{base}/_bench/stats") as response:
+                stub_stats = await response.json()
+    finally:
+        await parser.close()
+
+    return {
+        'config': vars(args),
+        'sweeps': results,
+        'stub': stub_stats,
+        'breakers': {source: health.stats() for source, health in parser.health.items()},
+        'http_cache': parser.http_cache.stats(),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if resource else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def main():
+    args = parse_args()
+    tmpdir = tempfile.mkdtemp(prefix='wb-bench-')
+    # Окружение задается до импорта приложения: модели читают DATABASE_URL при импорте
+    os.environ['DATABASE_URL'] = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.sqlite3')}"
+    os.environ.pop('REDIS_URL', None)
+    os.environ.pop('WB_HTTP_CACHE_FILE', None)
+    os.environ['NO_PROXY'] = '127.0.0.1,localhost'
+
+    from wb_stub import StubConfig, run_stub
+
+    port = free_port()
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.rate_429,
+                        args.v2_miss, args.change_rate, args.seed)
+    # Заглушка в отдельном процессе, чтобы не делить с трекером event loop и CPU
+    stub = multiprocessing.Process(target=run_stub, args=(port, config), daemon=True)
+    stub.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    print(f"База: {tmpdir}, заглушка WB: 127.0.0.1:{port}, товаров {args.products}, артикулов {args.articles}")
+    try:
+        report = asyncio.run(run(args, port))
+    finally:
+        stub.terminate()
+        stub.join()
+
+    print(f"Пиковый RSS: {report['peak_rss_mb']} МБ")
+    print(f"Breakers: { {source: stats['state'] for source, stats in report['breakers'].items()} }")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
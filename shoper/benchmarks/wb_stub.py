@@ -0,0 +1,169 @@
+"""Локальная заглушка API Wildberries для бенчмарков.
+
+Отвечает как card.wb.ru/cards/v2/detail, card.wb.ru/cards/detail (v1) и basket-NN card.json
+с настраиваемой задержкой, долей ошибок 5xx и ответов 429. Цены детерминированы (seed) и меняются
+у части артикулов при каждом POST /_bench/advance. GET /_bench/stats — счетчики запросов.
+
+Отдельный запуск:
+    python benchmarks/wb_stub.py --port 8765 --latency 30 --error-rate 0.01
+"""
+import os
+import sys
+import zlib
+import random
+import asyncio
+import argparse
+from collections import Counter
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.service.price_parser import load_basket_routes, WB_BASKET_ROUTES_FILE  # noqa: E402
+
+
+class StubConfig:
+    def __init__(self, latency: float = 20.0, jitter: float = 0.5, error_rate: float = 0.0,
+                 rate_429: float = 0.0, v2_miss: float = 0.05, change_rate: float = 0.1, seed: int = 1):
+        self.latency = latency  # медианная задержка ответа, мс
+        self.jitter = jitter  # разброс задержки (sigma логнормального распределения)
+        self.error_rate = error_rate  # доля ответов 503
+        self.rate_429 = rate_429  # доля ответов 429
+        self.v2_miss = v2_miss  # доля артикулов, которых нет в cards/v2 (половина есть в v1, остальные только в basket)
+        self.change_rate = change_rate  # доля артикулов, у которых меняется цена на /_bench/advance
+        self.seed = seed
+
+
+def _hash(value: str) -> int:
+    return zlib.crc32(value.encode())
+
+
+class WbStub:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.epoch = 0
+        self.prices = {}  # артикул -> цена в копейках (после изменений)
+        self.stats = Counter()
+        self.host_template, routes = load_basket_routes(WB_BASKET_ROUTES_FILE)
+        self.routes = routes
+
+    def price_cents(self, pid: int) -> int:
+        return self.prices.get(pid, 10000 + _hash(str(pid)) % 500000)
+
+    def in_v2(self, pid: int) -> bool:
+        return _hash(f"v2:{pid}") % 10000 >= self.config.v2_miss * 10000
+
+    def in_v1(self, pid: int) -> bool:
+        return self.in_v2(pid) or _hash(f"v1:{pid}") % 2 == 0
+
+    def basket_host(self, pid: int) -> str:
+        vol = pid // 100000
+        for max_vol, number in self.routes:
+            if vol <= max_vol:
+                return self.host_template.format(number)
+        return self.host_template.format(self.routes[-1][1] + 1 if self.routes else 1)
+
+    def product(self, pid: int, sizes_only: bool = False) -> dict:
+        price = self.price_cents(pid)
+        product = {'id': pid, 'name': f"Товар {pid}", 'sizes': [{'price': {'product': price}}]}
+        if not sizes_only:
+            product['salePriceU'] = price
+            product['priceU'] = price + price // 10
+        return product
+
+    async def _delay_or_fault(self, route: str):
+        """Задержка ответа и случайная ошибка; возвращает ответ-ошибку или None"""
+        self.stats[f"{route}:requests"] += 1
+        config = self.config
+        if config.latency > 0:
+            await asyncio.sleep(config.latency / 1000.0 * self.random.lognormvariate(0, config.jitter))
+        roll = self.random.random()
+        if roll < config.rate_429:
+            self.stats[f"{route}:429"] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        if roll < config.rate_429 + config.error_rate:
+            self.stats[f"{route}:503"] += 1
+            return web.Response(status=503)
+        return None
+
+    @staticmethod
+    def _ids(request: web.Request):
+        ids = []
+        for value in request.query.get('nm', '').split(';'):
+            if value.isdigit():
+                ids.append(int(value))
+        return ids
+
+    async def cards_v2(self, request: web.Request) -> web.Response:
+        fault = await self._delay_or_fault('v2')
+        if fault:
+            return fault
+        products = [self.product(pid) for pid in self._ids(request) if self.in_v2(pid)]
+        return web.json_response({'data': {'products': products}})
+
+    async def cards_v1(self, request: web.Request) -> web.Response:
+        fault = await self._delay_or_fault('v1')
+        if fault:
+            return fault
+        products = [self.product(pid, sizes_only=True) for pid in self._ids(request) if self.in_v1(pid)]
+        return web.json_response({'data': {'products': products}})
+
+    async def basket_card(self, request: web.Request) -> web.Response:
+        fault = await self._delay_or_fault('basket')
+        if fault:
+            return fault
+        pid = int(request.match_info['pid'])
+        if request.match_info['host'] != self.basket_host(pid):
+            self.stats['basket:404'] += 1
+            return web.Response(status=404)
+        price = self.price_cents(pid)
+        return web.json_response({'imt_name': f"Товар {pid}", 'salePriceU': price, 'priceU': price})
+
+    async def advance(self, request: web.Request) -> web.Response:
+        """Новая «эпоха»: у доли change_rate переданных артикулов меняется цена"""
+        self.epoch += 1
+        candidates = {int(value) for value in (await request.json()).get('ids', [])}
+        changed = 0
+        for pid in sorted(candidates):
+            if self.random.random() < self.config.change_rate:
+                price = self.price_cents(pid)
+                self.prices[pid] = max(100, price + self.random.choice((-1, 1)) * self.random.randint(100, price // 5 + 100))
+                changed += 1
+        return web.json_response({'epoch': self.epoch, 'changed': changed})
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/cards/v2/detail', self.cards_v2)
+        app.router.add_get('/cards/detail', self.cards_v1)
+        app.router.add_get(r'/{host}/vol{vol:\d+}/part{part:\d+}/{pid:\d+}/info/ru/card.json', self.basket_card)
+        app.router.add_post('/_bench/advance', self.advance)
+        app.router.add_get('/_bench/stats', self.stats_handler)
+        return app
+
+
+def run_stub(port: int, config: StubConfig):
+    """Точка входа для отдельного процесса бенчмарка"""
+    web.run_app(WbStub(config).app(), host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=20.0, help='медианная задержка, мс')
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--v2-miss', type=float, default=0.05)
+    parser.add_argument('--change-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(f"Заглушка WB: http://127.0.0.1:{args.port}")
+    run_stub(args.port, StubConfig(args.latency, args.jitter, args.error_rate, args.rate_429,
+                                   args.v2_miss, args.change_rate, args.seed))
+
+
+if __name__ == '__main__':
+    main()
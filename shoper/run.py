@@ -4,7 +4,17 @@ from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
 from app.handlers.user import router
 from app.database.models import init_models
+from app.database.redis_client import get_redis, close_redis
 from app.service.price_tracker import PriceTracker
+from app.service.price_parser import start_shared_parser, close_shared_parser
+from app.service.notifier import NotificationDispatcher
+from app.service.webhook import run_webhook, WEBHOOK_DRAIN_TIMEOUT
+from app.service.metrics import start_metrics_server, stop_metrics_server
+
+# embedded — трекер цен работает в процессе бота; external — в отдельных процессах tracker_worker.py
+TRACKER_MODE = os.getenv('WB_TRACKER_MODE', 'embedded')
+# polling — long polling; webhook — обновления приходят на HTTP-сервер бота (см. app/service/webhook.py)
+BOT_MODE = os.getenv('WB_MODE', 'polling')
 
 async def shutdown():
     print("Shutdown...")
@@ -22,29 +32,67 @@ async def main():
     print("BOT_TOKEN:", BOT_TOKEN)
     
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    # С REDIS_URL состояние диалогов (FSM) хранится в Redis: переживает перезапуск и общее для реплик
+    redis = get_redis()
+    if redis is not None:
+        from aiogram.fsm.storage.redis import RedisStorage
+        dp = Dispatcher(storage=RedisStorage(redis))
+    else:
+        dp = Dispatcher()
     # Подключаем router
     dp.include_router(router)
 
     dp.startup.register(startup)
     dp.shutdown.register(shutdown)
 
-    # Создаем и запускаем отслеживание цен
-    price_tracker = PriceTracker(bot)
-    
-    # Запускаем отслеживание цен в фоновом режиме
-    tracking_task = asyncio.create_task(price_tracker.start_tracking())
+    # Эндпоинт /metrics, если задан WB_METRICS_PORT
+    metrics_runner = await start_metrics_server()
+
+    # Общий парсер с пулом соединений для трекера и обработчиков /add, /check
+    parser = await start_shared_parser()
+
+    notifier = None
+    price_tracker = None
+    tracking_task = None
+    if TRACKER_MODE != 'external':
+        # Очередь уведомлений с учетом лимитов Telegram
+        notifier = NotificationDispatcher(bot)
+        await notifier.start()
+
+        # Создаем и запускаем отслеживание цен
+        price_tracker = PriceTracker(bot, parser, notifier=notifier)
+
+        # Запускаем отслеживание цен в фоновом режиме
+        tracking_task = asyncio.create_task(price_tracker.start_tracking())
     
-    try:
-        await dp.start_polling(bot)
-    finally:
-        # Останавливаем отслеживание при завершении
+    def health():
+        return {'notify_queue': notifier.queue_depth if notifier else None}
+
+    async def stop_background():
+        """Дожидается начатой проверки цен и отправляет очередь уведомлений, пока сессия бота открыта"""
+        nonlocal tracking_task
+        if tracking_task is None:
+            return
+        task, tracking_task = tracking_task, None
         await price_tracker.stop_tracking()
-        tracking_task.cancel()
         try:
-            await tracking_task
-        except asyncio.CancelledError:
-            pass
+            await asyncio.wait_for(task, WEBHOOK_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("Проверка цен не завершилась вовремя и прервана")
+        await notifier.stop()
+
+    try:
+        if BOT_MODE == 'webhook':
+            await run_webhook(dp, bot, health, on_drained=stop_background)
+        else:
+            await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        # Останавливаем отслеживание при завершении (в режиме webhook это уже сделал run_webhook)
+        await stop_background()
+        await bot.session.close()
+        await close_shared_parser()
+        await close_redis()
+        await stop_metrics_server(metrics_runner)
 
 if __name__ == "__main__":
     try:
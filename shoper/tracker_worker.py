@@ -0,0 +1,62 @@
+"""Отдельный процесс трекера цен.
+
+Бот (run.py с WB_TRACKER_MODE=external) только обрабатывает команды, а проверкой цен
+занимаются один или несколько таких воркеров. Каждый воркер проверяет свою часть артикулов
+(партиции по хэшу артикула); если воркер пропадает, его партиции забирают остальные.
+
+Запуск: python tracker_worker.py  (столько процессов, сколько нужно)
+"""
+import os
+import asyncio
+from dotenv import load_dotenv
+from aiogram import Bot
+from app.database.models import init_models
+from app.database.redis_client import close_redis
+from app.service.price_tracker import PriceTracker
+from app.service.price_parser import start_shared_parser, close_shared_parser
+from app.service.notifier import NotificationDispatcher
+from app.service.tracker_partition import PartitionLease
+from app.service.metrics import start_metrics_server, stop_metrics_server
+
+
+async def main():
+    await init_models()
+
+    load_dotenv()
+    # Bot нужен воркеру только для отправки уведомлений, обновления он не получает
+    bot = Bot(token=os.getenv("BOT_TOKEN"))
+
+    metrics_runner = await start_metrics_server()
+    parser = await start_shared_parser()
+    notifier = NotificationDispatcher(bot)
+    await notifier.start()
+
+    lease = PartitionLease(os.getenv('WB_TRACKER_WORKER_ID'))
+    price_tracker = PriceTracker(bot, parser, notifier=notifier, owns=lease.owns)
+    lease.on_change = price_tracker.request_refresh
+    await lease.heartbeat()
+    print(f"Воркер трекера {lease.worker_id} запущен")
+
+    heartbeat_task = asyncio.create_task(lease.run())
+    try:
+        await price_tracker.start_tracking()
+    finally:
+        await price_tracker.stop_tracking()
+        heartbeat_task.cancel()
+        try:
+            await heartbeat_task
+        except asyncio.CancelledError:
+            pass
+        await lease.release()
+        await notifier.stop()
+        await close_shared_parser()
+        await close_redis()
+        await stop_metrics_server(metrics_runner)
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, SystemExit):
+        pass